@@ -459,7 +459,7 @@
 # if __name__ == '__main__':
 #     app.run(host='0.0.0.0', port=5002, debug=True)
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import google.generativeai as genai
 import os
@@ -467,26 +467,46 @@ from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
 import threading
 import time
-from paddleocr import PaddleOCR
 import uuid
-import psycopg2
-from psycopg2 import pool
+import atexit
+import json
+
+# Load environment variables (before the scripts below, which read their config at import)
+load_dotenv()
 
 # Import your existing functions
-from scripts.extract_label import extract_ingredients_hybrid, extract_label
+from scripts.ocr_engines import OCR_ENGINES, extract_ingredients, warm_up_ocr_engines, ocr_engine_stats
 from scripts.databasemethods import (
     setup_database,
     add_ingredient,
     view_all_ingredients,
     find_similar_ingredients,
     clear_all_ingredients,
-    connect_db
+    add_ingredients,
+    get_lookup_cache_stats,
+    get_lookup_tier_stats,
+    get_embedding_cache_stats,
+    get_embedding_model,
+    get_similarity_index,
+    warm_up_embedding_model,
+    warm_up_similarity_index,
+    ensure_embeddings_current,
+    embeddings_current
+)
+from scripts.db_pool import init_db_pool, check_database_health, close_db_pool, pool_stats
+from scripts.memory_stats import process_memory, format_memory
+from scripts.warmup import WarmUp
+from scripts.job_queue import JobQueue, QueueFull
+from scripts.job_store import create_job_store
+from scripts.filter_ingredients_new import (
+    filter_ingredients,
+    batch_analyze_ingredients,
+    get_llm_flight_stats,
+    start_llm_scheduler,
+    stop_llm_scheduler,
+    get_llm_scheduler_stats
 )
-from scripts.filter_ingredients_new import filter_ingredients, batch_analyze_ingredients
-
 
-# Load environment variables
-load_dotenv()
 
 app = Flask(__name__)
 
@@ -505,48 +525,74 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# Analysis job queue (bounded, so traffic spikes are shed instead of spawning threads)
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "4"))
+ANALYSIS_QUEUE_DEPTH = int(os.getenv("ANALYSIS_QUEUE_DEPTH", "32"))
+ANALYSIS_RETRY_AFTER = int(os.getenv("ANALYSIS_RETRY_AFTER", "5"))  # seconds, sent when full
+ANALYSIS_DRAIN_TIMEOUT = float(os.getenv("ANALYSIS_DRAIN_TIMEOUT", "30"))  # seconds on shutdown
+
+# Job store: "memory" (this process only) or "postgres" (shared by all gunicorn workers)
+JOB_STORE_BACKEND = os.getenv("JOB_STORE_BACKEND", "memory")
+# Finished jobs are kept JOB_TTL seconds for clients to fetch results
+JOB_TTL = float(os.getenv("JOB_TTL", "600"))
+JOB_STORE_MAX_ENTRIES = int(os.getenv("JOB_STORE_MAX_ENTRIES", "1000"))  # memory backend only
+
+# Progress streams (/api/stream): keep-alive interval and how long one connection stays open
+# (EventSource reconnects on its own and resumes from the last event it saw)
+STREAM_KEEPALIVE = float(os.getenv("STREAM_KEEPALIVE", "15"))
+STREAM_MAX_DURATION = float(os.getenv("STREAM_MAX_DURATION", "300"))
+
+# OCR engine for /api/upload ("gemini", "paddle" or "tesseract"). A request can pick
+# another with the ocr_engine form field, but only one listed in OCR_ALLOWED_ENGINES
+# (comma-separated, default just OCR_ENGINE), so clients can't make every worker load
+# PaddleOCR. Engines load on first use, or at startup if listed in OCR_WARMUP
+OCR_ENGINE = os.getenv("OCR_ENGINE", "gemini")
+OCR_ALLOWED_ENGINES = {
+    name.strip() for name in os.getenv("OCR_ALLOWED_ENGINES", OCR_ENGINE).split(",") if name.strip()
+} | {OCR_ENGINE}
+OCR_WARMUP = [name.strip() for name in os.getenv("OCR_WARMUP", "").split(",") if name.strip()]
+
+# Load the embedding model, run it once and prime the similarity index in the background
+# at startup; /api/health answers 503 "warming" until done (0 = load lazily on first use)
+WARMUP = os.getenv("WARMUP", "1") == "1"
+
+# Set by gunicorn.conf.py when this module is imported once in the gunicorn master
+# (preload_app): import then only loads read-only state, and each worker starts its
+# own connections and threads after fork (see start_worker_services)
+PRELOADED = os.getenv("APP_PRELOADED") == "1"
+
 # Global variables
 model = None
-ocr = None
-analysis_cache = {}  # Store analysis results by job_id
-db_pool = None  # PostgreSQL connection pool
+# Analysis state by job_id
+if JOB_STORE_BACKEND == "memory":
+    job_store = create_job_store("memory", ttl=JOB_TTL, max_entries=JOB_STORE_MAX_ENTRIES)
+else:
+    job_store = create_job_store(JOB_STORE_BACKEND, ttl=JOB_TTL)
+analysis_queue = JobQueue(workers=ANALYSIS_WORKERS, max_depth=ANALYSIS_QUEUE_DEPTH)
+warm_up = WarmUp([
+    ("embedding_model", warm_up_embedding_model),
+    # After an EMBEDDING_BACKEND switch, re-encode stored embeddings before the index loads them
+    ("stored_embeddings", ensure_embeddings_current),
+    ("similarity_index", warm_up_similarity_index),
+    ("ocr_engines", lambda: warm_up_ocr_engines(OCR_WARMUP))
+])
 
 def initialize_db_pool():
-    """Initialize PostgreSQL connection pool"""
-    global db_pool
+    """Initialize the PostgreSQL connection pool shared by the database layer"""
     try:
-        db_pool = psycopg2.pool.SimpleConnectionPool(
-            1,  # minimum connections
-            10,  # maximum connections
-            host=os.getenv("DB_HOST", "localhost"),
-            port=os.getenv("DB_PORT", "5432"),
-            database=os.getenv("DB_NAME", "ingredients_db"),
-            user=os.getenv("DB_USER", "postgres"),
-            password=os.getenv("DB_PASSWORD", "postgres")
-        )
+        init_db_pool()
         print("✅ PostgreSQL connection pool initialized")
         return True
     except Exception as e:
         print(f"❌ Failed to initialize database pool: {e}")
         return False
 
-def get_db_connection():
-    """Get a connection from the pool"""
-    if db_pool:
-        return db_pool.getconn()
-    return None
-
-def return_db_connection(conn):
-    """Return a connection to the pool"""
-    if db_pool and conn:
-        db_pool.putconn(conn)
-
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def initialize_model_and_database():
-    """Initialize Gemini model and database on startup"""
-    global model, ocr
+def initialize_gemini():
+    """Configure the Gemini client and start the LLM batch scheduler"""
+    global model
     
     print("🚀 Initializing Gemini model...")
     API_KEY = os.getenv('API_KEY')
@@ -556,17 +602,75 @@ def initialize_model_and_database():
         genai.configure(api_key=API_KEY)
         model = genai.GenerativeModel('gemini-2.5-flash')
         print("✅ Gemini model initialized")
-    
+        if start_llm_scheduler(model):
+            print("✅ LLM batch scheduler started")
+
+def initialize_database():
+    """Create the connection pool and make sure the schema exists"""
     print("🗄️ Setting up database connection pool...")
     if initialize_db_pool():
         print("🗄️ Setting up database schema...")
         try:
             setup_database()
+            job_store.setup()
             print("✅ Database setup complete")
+            return True
         except Exception as e:
             print(f"❌ Database setup error: {e}")
     else:
         print("❌ Failed to initialize database - check your PostgreSQL configuration")
+    return False
+
+def initialize_model_and_database():
+    """Initialize Gemini model and database on startup"""
+    initialize_gemini()
+    initialize_database()
+
+def start_warm_up():
+    """Warm up in the background if enabled, else just load the OCR engines asked for"""
+    if WARMUP:
+        warm_up.start()
+    else:
+        warm_up_ocr_engines(OCR_WARMUP)
+
+def preload_shared_state():
+    """
+    Load read-only state in the gunicorn master, before workers fork
+    
+    The embedding model and the (memory-mapped) similarity index are then
+    shared copy-on-write by every worker instead of loaded once per worker.
+    Nothing here may start threads or keep sockets open: the pool used to
+    build the index is closed again, and the model is not run (its thread
+    pools, and for the ONNX backends the inference session itself, are
+    created on first encode, in the workers).
+    """
+    print("📦 Preloading shared state in the gunicorn master...")
+    if initialize_database():
+        try:
+            # Re-encoding would run the model here; the workers do it instead
+            if embeddings_current():
+                get_similarity_index()
+            else:
+                print("⚠️ Stored embeddings come from another model; workers re-encode them before loading the index")
+        except Exception as e:
+            print(f"❌ Similarity index preload failed: {e}")
+    get_embedding_model()
+    close_db_pool()
+    print(f"📦 Preload complete: {format_memory(process_memory())}")
+
+def start_worker_services():
+    """
+    Start what can't be inherited across fork (called in each gunicorn worker)
+    
+    The database pool, Gemini client, analysis queue threads and LLM
+    scheduler all hold sockets or threads, so each worker creates its own.
+    The embedding cache's SQLite connection reopens itself on first use.
+    """
+    initialize_gemini()
+    initialize_db_pool()
+    analysis_queue.start()
+    start_warm_up()
+    print(f"👷 Worker {os.getpid()} ready: {format_memory(process_memory())}")
 
 def seed_database_background():
     """Seed database with common ingredients in background"""
@@ -759,60 +863,99 @@ def seed_database_background():
     }
     
     try:
-        for ingredient, flags in common_ingredients.items():
-            add_ingredient(ingredient, flags)
+        report = add_ingredients(common_ingredients)
         
-        print(f"✅ Database seeded with {len(common_ingredients)} common ingredients")
+        print(f"✅ Database seeded with {report['rows']} common ingredients "
+              f"({report['rows_per_second']:.0f} rows/s)")
     except Exception as e:
         print(f"❌ Error seeding database: {e}")
 
-def analyze_ingredients_background(job_id, ingredients_list, filters):
+def publish_progress(job_id, events):
+    """Store progress events for /api/stream (best effort, never fails the job)"""
+    try:
+        job_store.append_events(job_id, events)
+    except Exception as e:
+        print(f"⚠ Could not publish progress for job {job_id}: {e}")
+
+def analyze_ingredients_background(job_id, ingredients_list, filters, early_exit=False, full_failing=False):
     """Analyze ingredients in background and store results"""
     try:
         print(f"🔬 Starting analysis for job {job_id}...")
-        analysis_cache[job_id]['status'] = 'analyzing'
+        job_store.update(job_id, status='analyzing')
+        
+        skipped = []
+        
+        def on_progress(events):
+            for event in events:
+                if event['type'] == 'skipped':
+                    skipped.extend(event['ingredients'])
+            publish_progress(job_id, events)
         
         # Run the filter_ingredients function
         results, failing = filter_ingredients(
             ingredients_list,
             model,
             filters,
-            similarity_threshold=0.85
+            similarity_threshold=0.85,
+            on_progress=on_progress,
+            early_exit=early_exit,
+            full_failing=full_failing
         )
         
         # Store results
-        analysis_cache[job_id]['status'] = 'complete'
-        analysis_cache[job_id]['results'] = results
-        analysis_cache[job_id]['failing'] = failing
+        job_store.update(job_id, status='complete', results=results, failing=failing, skipped=skipped)
         
         print(f"✅ Analysis complete for job {job_id}")
         
     except Exception as e:
         print(f"❌ Analysis error for job {job_id}: {e}")
-        analysis_cache[job_id]['status'] = 'error'
-        analysis_cache[job_id]['error'] = str(e)
+        job_store.update(job_id, status='error', error=str(e))
 
 # ========== ENDPOINTS ==========
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Check if server is running and model is initialized"""
-    db_healthy = False
+    """
+    Check if server is running and model is initialized
+    
+    Answers 503 with status "warming" while the warm-up is still running, so
+    a load balancer only routes traffic to this worker once it is hot. Not
+    healthy either while the stored embeddings come from another model than
+    the one this worker encodes queries with.
+    """
+    db_healthy = check_database_health()
     try:
-        conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT 1")
-            cursor.close()
-            return_db_connection(conn)
-            db_healthy = True
-    except Exception as e:
-        print(f"Database health check failed: {e}")
+        embeddings_ok = db_healthy and embeddings_current()
+    except Exception:
+        embeddings_ok = False
+    healthy = model is not None and db_healthy and embeddings_ok
+    if warm_up.warming:
+        status = 'warming'
+    else:
+        status = 'healthy' if healthy else 'degraded'
     
     return jsonify({
-        'status': 'healthy' if (model is not None and db_healthy) else 'degraded',
+        'status': status,
         'model_initialized': model is not None,
-        'database_ready': db_healthy
-    }), 200 if (model is not None and db_healthy) else 503
+        'database_ready': db_healthy,
+        'embeddings_current': embeddings_ok,
+        'warm_up': warm_up.stats()
+    }), 200 if status == 'healthy' else 503
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Runtime counters for monitoring"""
+    return jsonify({
+        'ingredient_cache': get_lookup_cache_stats(),
+        'lookup_tiers': get_lookup_tier_stats(),
+        'embedding_cache': get_embedding_cache_stats(),
+        'llm_lookups': get_llm_flight_stats(),
+        'llm_batches': get_llm_scheduler_stats(),
+        'analysis_queue': analysis_queue.stats(),
+        'job_store': job_store.stats(),
+        'db_pool': pool_stats(),
+        'ocr_engines': ocr_engine_stats(),
+        'process_memory': process_memory()
+    }), 200
 
 @app.route('/api/upload', methods=['POST'])
 def upload_image():
@@ -833,6 +976,12 @@ def upload_image():
     if not allowed_file(file.filename):
         return jsonify({'error': 'Invalid file type'}), 400
     
+    ocr_engine = request.form.get('ocr_engine', OCR_ENGINE)
+    if ocr_engine not in OCR_ENGINES:
+        return jsonify({'error': f"Unknown ocr_engine, expected one of: {', '.join(OCR_ENGINES)}"}), 400
+    if ocr_engine not in OCR_ALLOWED_ENGINES:
+        return jsonify({'error': f"ocr_engine not enabled, expected one of: {', '.join(sorted(OCR_ALLOWED_ENGINES))}"}), 400
+    
     ingredients_list = []
     try:
         # Save file
@@ -843,8 +992,8 @@ def upload_image():
         print(f"📁 File uploaded: {filename}")
         
         # Extract ingredients from image
-        print("🔍 Extracting ingredients from image...")
-        text_from_img = extract_label(model, filepath)
+        print(f"🔍 Extracting ingredients from image ({ocr_engine})...")
+        text_from_img = extract_ingredients(filepath, ocr_engine, model)
         
         # Format as list
         ingredients_list = [item.strip().lower() for item in text_from_img.split(",")]
@@ -872,6 +1021,12 @@ def start_analysis():
     """
     Step 2: Start analyzing ingredients against filters
     Runs in background, returns immediately with job_id
+    
+    Optional fields:
+        early_exit: Stop once every filter has failed, skipping LLM lookups
+            (ingredients left unresolved are returned as `skipped`)
+        full_failing: With early_exit, still resolve every ingredient so
+            `failing` is complete; the verdict is streamed early instead
     """
     data = request.get_json()
     
@@ -885,20 +1040,31 @@ def start_analysis():
     if not isinstance(filters, list) or len(filters) == 0:
         return jsonify({'error': 'Filters must be a non-empty list'}), 400
     
-    # Initialize cache entry
-    analysis_cache[job_id] = {
+    early_exit = bool(data.get('early_exit', False))
+    full_failing = bool(data.get('full_failing', False))
+    
+    # Register the job
+    job_store.create(job_id, {
         'status': 'pending',
         'ingredients': ingredients_list,
         'filters': filters
-    }
+    })
     
-    # Start analysis in background
-    thread = threading.Thread(
-        target=analyze_ingredients_background,
-        args=(job_id, ingredients_list, filters)
-    )
-    thread.daemon = True
-    thread.start()
+    # Queue analysis for a background worker
+    try:
+        analysis_queue.submit(
+            analyze_ingredients_background, job_id, ingredients_list, filters,
+            early_exit=early_exit, full_failing=full_failing
+        )
+    except QueueFull as e:
+        print(f"⏳ Rejected job {job_id}: {e}")
+        job_store.delete(job_id)
+        response = jsonify({
+            'error': 'Server is busy, please retry shortly',
+            'retry_after': ANALYSIS_RETRY_AFTER
+        })
+        response.headers['Retry-After'] = str(ANALYSIS_RETRY_AFTER)
+        return response, 503
     
     print(f"🚀 Started analysis for job {job_id}")
     
@@ -914,11 +1080,10 @@ def check_status(job_id):
     Step 3: Check analysis status
     Returns current progress/status without blocking
     """
-    if job_id not in analysis_cache:
+    job_data = job_store.get(job_id)
+    if job_data is None:
         return jsonify({'error': 'Job not found'}), 404
     
-    job_data = analysis_cache[job_id]
-    
     response = {
         'job_id': job_id,
         'status': job_data['status']
@@ -927,21 +1092,88 @@ def check_status(job_id):
     if job_data['status'] == 'complete':
         response['results'] = job_data['results']
         response['failing'] = job_data['failing']
+        response['skipped'] = job_data.get('skipped', [])
     elif job_data['status'] == 'error':
         response['error'] = job_data.get('error', 'Unknown error')
     
     return jsonify(response), 200
 
+def format_sse(event, data, event_id=None):
+    """Encode one Server-Sent Event"""
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + f"data: {json.dumps(data)}\n\n"
+
+@app.route('/api/stream/<job_id>', methods=['GET'])
+def stream_progress(job_id):
+    """
+    Step 3 (streaming): Push analysis progress as Server-Sent Events
+    Sends a `progress` event per ingredient/filter update, a `status` event
+    whenever the job's status changes, then one `complete` event carrying
+    the final results (or an `error` event). Quiet periods get a comment
+    line every STREAM_KEEPALIVE seconds so proxies keep the connection.
+    """
+    if job_store.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    try:
+        cursor = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        cursor = 0
+    
+    def generate(cursor):
+        deadline = time.monotonic() + STREAM_MAX_DURATION
+        last_status = None
+        yield "retry: 2000\n\n"
+        while time.monotonic() < deadline:
+            job_data, events, cursor = job_store.events(job_id, cursor, timeout=STREAM_KEEPALIVE)
+            if job_data is None:
+                yield format_sse('error', {'error': 'Job not found'})
+                return
+            
+            # Only the last event of a batch carries the resume cursor
+            for n, event in enumerate(events, 1):
+                yield format_sse('progress', event, event_id=cursor if n == len(events) else None)
+            
+            if job_data['status'] == 'complete':
+                yield format_sse('complete', {
+                    'status': 'complete',
+                    'results': job_data['results'],
+                    'failing': job_data['failing'],
+                    'skipped': job_data.get('skipped', []),
+                    'ingredients': job_data['ingredients'],
+                    'filters': job_data['filters']
+                }, event_id=cursor)
+                return
+            if job_data['status'] == 'error':
+                yield format_sse('error', {
+                    'status': 'error',
+                    'error': job_data.get('error', 'Unknown error')
+                }, event_id=cursor)
+                return
+            
+            if job_data['status'] != last_status:
+                last_status = job_data['status']
+                yield format_sse('status', {'status': last_status})
+            elif not events:
+                yield ": keepalive\n\n"
+    
+    return Response(
+        stream_with_context(generate(cursor)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/results/<job_id>', methods=['GET'])
 def get_results(job_id):
     """
     Step 4: Get final results (only returns when complete)
     """
-    if job_id not in analysis_cache:
+    job_data = job_store.get(job_id)
+    if job_data is None:
         return jsonify({'error': 'Job not found'}), 404
     
-    job_data = analysis_cache[job_id]
-    
     if job_data['status'] == 'pending' or job_data['status'] == 'analyzing':
         return jsonify({
             'status': job_data['status'],
@@ -960,6 +1192,7 @@ def get_results(job_id):
         'status': 'complete',
         'results': job_data['results'],
         'failing': job_data['failing'],
+        'skipped': job_data.get('skipped', []),
         'ingredients': job_data['ingredients'],
         'filters': job_data['filters']
     }), 200
@@ -979,16 +1212,28 @@ def seed_database():
         return jsonify({'error': str(e)}), 500
 
 # Cleanup function
-@app.teardown_appcontext
-def cleanup_db_pool(exception=None):
-    """Close all database connections when app context ends"""
-    global db_pool
-    if db_pool:
-        db_pool.closeall()
-        print("🔒 Database connection pool closed")
-
-# Initialize on startup
-initialize_model_and_database()
+def cleanup_db_pool():
+    """Close all database connections when the process exits"""
+    close_db_pool()
+    print("🔒 Database connection pool closed")
+
+def drain_analysis_queue():
+    """Let queued and running analyses finish before the process exits"""
+    print("⏳ Draining analysis queue...")
+    analysis_queue.shutdown(timeout=ANALYSIS_DRAIN_TIMEOUT)
+
+# Run in reverse order at exit: drain jobs, then stop the scheduler, then close the pool
+atexit.register(cleanup_db_pool)
+atexit.register(stop_llm_scheduler)
+atexit.register(drain_analysis_queue)
+
+# Initialize on startup (under a preloading gunicorn master, workers finish this in post_fork)
+if PRELOADED:
+    preload_shared_state()
+else:
+    initialize_model_and_database()
+    analysis_queue.start()
+    start_warm_up()
 
 # Optional: Seed database on startup (comment out if not needed)
 # threading.Thread(target=seed_database_background, daemon=True).start()
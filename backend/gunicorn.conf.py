@@ -0,0 +1,37 @@
+"""
+Gunicorn settings (used by procfile and render.yaml via -c gunicorn.conf.py)
+
+With preload_app the app is imported once in the master: the embedding
+model and the memory-mapped similarity index are loaded before workers
+fork and shared copy-on-write, instead of loaded by every worker. Anything
+holding sockets or threads (database pool, Gemini client, analysis queue,
+LLM scheduler) is started per worker in post_fork.
+
+Set GUNICORN_PRELOAD=0 to go back to each worker loading everything itself.
+Per-worker memory is logged at startup and served by /api/stats; for the
+whole process tree run `python -m scripts.memory_stats <master pid>`.
+"""
+import gc
+import os
+
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+# Worker count comes from WEB_CONCURRENCY (gunicorn's own default), else 1
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+if preload_app:
+    # Tells app.py to load only fork-safe state at import (see app.PRELOADED)
+    os.environ["APP_PRELOADED"] = "1"
+
+
+def when_ready(server):
+    if preload_app:
+        # Move everything loaded so far out of the garbage collector's view,
+        # so collections in the workers don't write to (and un-share) those pages
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        import app
+        app.start_worker_services()
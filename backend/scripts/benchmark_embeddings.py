@@ -0,0 +1,113 @@
+"""
+Latency, throughput and memory of the embedding backends
+
+Each backend runs in a process of its own, so RSS is comparable, and its
+embeddings are checked against the torch backend's (cosine per text).
+Texts are the preload ingredients plus common variants of them.
+
+Usage (from backend/):
+    python -m scripts.benchmark_embeddings
+    python -m scripts.benchmark_embeddings --backends torch,onnx-int8 --texts 5000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+PRELOAD_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database", "preload.json")
+VARIANTS = ["{}", "organic {}", "{} powder", "{} extract", "natural {} flavor", "dried {}", "{} (for color)"]
+
+
+def load_texts(count):
+    with open(PRELOAD_PATH) as f:
+        names = list(json.load(f))
+    texts = [variant.format(name) for variant in VARIANTS for name in names]
+    return [texts[i % len(texts)] for i in range(count)]
+
+
+def measure(backend, texts, out_path, latency_samples=200):
+    """Benchmark one backend in this process and save its embeddings to out_path"""
+    from dotenv import load_dotenv
+    load_dotenv()  # before databasemethods reads its config (ONNX dir, threads)
+    from scripts.databasemethods import EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_DIR, EMBEDDING_THREADS
+    from scripts.embedding_backends import create_embedder
+    from scripts.memory_stats import process_memory
+
+    rss_before = process_memory().get("rss_mb")
+    start = time.perf_counter()
+    embedder = create_embedder(backend, EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_DIR, EMBEDDING_THREADS)
+    load_seconds = time.perf_counter() - start
+    embedder.encode(texts[:32])
+
+    latencies = []
+    for text in texts[:latency_samples]:
+        start = time.perf_counter()
+        embedder.encode([text])
+        latencies.append(1000 * (time.perf_counter() - start))
+
+    start = time.perf_counter()
+    embeddings = embedder.encode(texts, batch_size=32)
+    seconds = time.perf_counter() - start
+    np.save(out_path, embeddings)
+
+    memory = process_memory()
+    return {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "texts_per_second": round(len(texts) / seconds, 1),
+        "rss_mb": memory.get("rss_mb"),
+        "model_rss_mb": round(memory["rss_mb"] - rss_before, 1) if memory and rss_before else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends")
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    texts = load_texts(args.texts)
+
+    if args.child:
+        print(json.dumps(measure(args.child, texts, args.out)))
+        return
+
+    backends = args.backends.split(",")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in backends:
+            out_path = os.path.join(tmp, f"{backend}.npy")
+            proc = subprocess.run(
+                [sys.executable, "-m", "scripts.benchmark_embeddings", "--child", backend,
+                 "--texts", str(args.texts), "--out", out_path],
+                capture_output=True, text=True
+            )
+            if proc.returncode != 0:
+                print(f"{backend}: failed\n{proc.stderr.strip()}")
+                continue
+            results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+            results[backend]["embeddings"] = np.load(out_path)
+
+    reference = results.get("torch", {}).get("embeddings")
+    print(f"{len(texts)} texts, batch size 32 for throughput, single texts for latency")
+    print(f"{'backend':10} {'load s':>7} {'p50 ms':>7} {'p95 ms':>7} {'texts/s':>8} "
+          f"{'RSS MB':>7} {'model MB':>9} {'min cos':>8} {'mean cos':>9}")
+    for backend, result in results.items():
+        min_cos = mean_cos = float("nan")
+        if reference is not None:
+            cosines = np.sum(result["embeddings"] * reference, axis=1)
+            min_cos, mean_cos = float(cosines.min()), float(cosines.mean())
+        print(f"{backend:10} {result['load_seconds']:7.2f} {result['p50_ms']:7.2f} {result['p95_ms']:7.2f} "
+              f"{result['texts_per_second']:8.1f} {result['rss_mb'] or 0:7.0f} {result['model_rss_mb'] or 0:9.0f} "
+              f"{min_cos:8.5f} {mean_cos:9.5f}")
+
+
+if __name__ == "__main__":
+    main()
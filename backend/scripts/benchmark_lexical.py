@@ -0,0 +1,129 @@
+"""
+Hit rate, false matches and latency of the lexical (trigram) tier
+
+Queries are variants of catalogue names (plural, "organic X", punctuation,
+one-character typos) whose right answer is the name they came from. False
+matches are measured leave-one-out: each catalogue name is looked up with
+itself excluded, so anything it matches above the threshold is a different
+ingredient. Modifier variants ("X-free", "non-X", "vegan X") are different
+ingredients too: they are looked up against the catalogue, and the plain
+names against a catalogue of the modified ones, and any match is false.
+
+Usage (from backend/):
+    python -m scripts.benchmark_lexical              # names from database/preload.json
+    python -m scripts.benchmark_lexical --database   # names from the ingredients table
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+from scripts.lexical_index import LexicalIndex
+
+PRELOAD_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database", "preload.json")
+THRESHOLDS = (0.7, 0.75, 0.8, 0.85, 0.9, 0.95)
+
+
+def load_names(database=False):
+    if database:
+        from dotenv import load_dotenv
+        load_dotenv()
+        from scripts.databasemethods import _fetch_index_rows
+        return [row["name"] for row in _fetch_index_rows()]
+    with open(PRELOAD_PATH) as f:
+        return list(json.load(f))
+
+
+def _typo(name, rng):
+    """Substitute, drop or swap one character (not the first)"""
+    if len(name) < 4:
+        return None
+    i = rng.randrange(1, len(name) - 1)
+    kind = rng.choice(("substitute", "drop", "swap"))
+    if kind == "substitute":
+        return name[:i] + rng.choice("aeioulnrst") + name[i + 1:]
+    if kind == "drop":
+        return name[:i] + name[i + 1:]
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+
+def variants(names, seed=0):
+    """{kind: [(query, expected name)]}"""
+    rng = random.Random(seed)
+    return {
+        "plural": [(name + ("" if name.endswith("s") else "s"), name) for name in names],
+        "qualifier": [(f"organic {name}", name) for name in names],
+        "punctuation": [(f"{name.upper()}.", name) for name in names],
+        "typo": [(typo, name) for name in names if (typo := _typo(name, rng))],
+    }
+
+
+def modifier_variants(names):
+    """{kind: [modified name]}, each a different ingredient from the name it came from"""
+    return {
+        "x-free": [f"{name}-free" for name in names],
+        "non-x": [f"non-{name}" for name in names],
+        "vegan x": [f"vegan {name}" for name in names],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the lexical similarity tier")
+    parser.add_argument("--database", action="store_true", help="Use the ingredients table as the catalogue")
+    args = parser.parse_args()
+
+    names = load_names(args.database)
+    index = LexicalIndex()
+    start = time.perf_counter()
+    index.add_many(names)
+    print(f"Indexed {len(names)} names in {1000 * (time.perf_counter() - start):.1f} ms")
+
+    queries = variants(names)
+    results = {kind: [] for kind in queries}
+    reverse_indexes = {}
+    for kind, modified_names in modifier_variants(names).items():
+        reverse_indexes[kind] = LexicalIndex()
+        reverse_indexes[kind].add_many(modified_names)
+    searches = 0
+    start = time.perf_counter()
+    for kind, pairs in queries.items():
+        for query, expected in pairs:
+            match = index.search(query, top_k=1)
+            results[kind].append((match[0] if match else (None, 0.0), expected))
+            searches += 1
+    # Leave-one-out: the best match other than the name itself
+    held_out = []
+    for name in names:
+        others = [match for match in index.search(name, top_k=2) if match[0] != name]
+        held_out.append(others[0][1] if others else 0.0)
+        searches += 1
+    # Modifier variants: any match, in either direction, is a false one
+    modified = {}
+    for kind, modified_names in modifier_variants(names).items():
+        modified[kind] = []
+        for query, name in zip(modified_names, names):
+            for match in (index.search(query, top_k=1), reverse_indexes[kind].search(name, top_k=1)):
+                modified[kind].append(match[0][1] if match else 0.0)
+                searches += 1
+    microseconds = 1e6 * (time.perf_counter() - start) / searches
+    print(f"{searches} lookups, {microseconds:.0f} us each\n")
+
+    print(f"{'threshold':>9} " + " ".join(f"{kind + ' hit/wrong':>22}" for kind in results)
+          + f" {'held-out false':>15}" + "".join(f" {kind + ' false':>14}" for kind in modified))
+    for threshold in THRESHOLDS:
+        cells = []
+        for kind, outcomes in results.items():
+            hits = sum(1 for (name, score), expected in outcomes if score >= threshold and name == expected)
+            wrong = sum(1 for (name, score), expected in outcomes if score >= threshold and name != expected)
+            cells.append(f"{hits / len(outcomes):>11.1%}/{wrong / len(outcomes):<10.1%}")
+        false_rate = sum(1 for score in held_out if score >= threshold) / len(held_out)
+        modifier_cells = [
+            sum(1 for score in scores if score >= threshold) / len(scores) for scores in modified.values()
+        ]
+        print(f"{threshold:>9} " + " ".join(cells) + f" {false_rate:>15.1%}"
+              + "".join(f" {rate:>14.1%}" for rate in modifier_cells))
+
+
+if __name__ == "__main__":
+    main()
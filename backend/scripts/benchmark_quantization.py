@@ -0,0 +1,108 @@
+"""
+Recall of quantized similarity indexes against float32
+
+Builds one index per storage dtype from the same catalogue and checks how
+often the quantized top-1 match (and the match/no-match verdict at the
+similarity threshold) agrees with float32.
+
+Usage (from backend/):
+    python -m scripts.benchmark_quantization                 # catalogue from the database
+    python -m scripts.benchmark_quantization --queries q.txt # one ingredient string per line
+    python -m scripts.benchmark_quantization --synthetic 20000
+
+Without --queries, queries are catalogue vectors with noise added, spread
+so that their best similarity falls on both sides of the threshold.
+"""
+import argparse
+import time
+import numpy as np
+from dotenv import load_dotenv
+
+from scripts.dietary_flags import FLAG_KEYS
+from scripts.embedding_codec import EMBEDDING_DTYPES, decode_embedding, encode_embedding
+from scripts.similarity_index import create_index
+
+
+def load_catalogue():
+    """(names, embeddings) of every ingredient with an embedding"""
+    from scripts.databasemethods import _fetch_index_rows, deserialize_embedding
+    rows = _fetch_index_rows()
+    return [row["name"] for row in rows], np.vstack([deserialize_embedding(row["embedding"]) for row in rows])
+
+
+def noisy_queries(embeddings, count, seed=0):
+    """Catalogue vectors plus Gaussian noise of varying strength"""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(embeddings), count, replace=len(embeddings) < count)
+    vectors = embeddings[picks] / np.linalg.norm(embeddings[picks], axis=1, keepdims=True)
+    # cos(v, v + noise) ~ 1 / sqrt(1 + dim * sigma^2): 0.01-0.06 spans ~0.98 down to ~0.65 at 384 dims
+    sigma = rng.uniform(0.01, 0.06, size=(count, 1)) * np.sqrt(384 / embeddings.shape[1])
+    return (vectors + rng.normal(size=vectors.shape) * sigma).astype(np.float32)
+
+
+def run(names, embeddings, queries, threshold=0.85, top_k=5):
+    results = {}
+    for dtype in EMBEDDING_DTYPES:
+        # Round-trip through the blob format too, as the stored column would be
+        stored = np.vstack([decode_embedding(encode_embedding(vector, dtype)) for vector in embeddings])
+        index = create_index(FLAG_KEYS, dtype=dtype)
+        index.add_many(names, stored, masks=([0] * len(names), [0] * len(names)))
+
+        start = time.perf_counter()
+        matches = index.search_many(queries, top_k=top_k, decode=False)
+        seconds = time.perf_counter() - start
+        results[dtype] = {
+            "matches": matches,
+            "megabytes": index.nbytes() / 1e6,
+            "blob_bytes": len(encode_embedding(embeddings[0], dtype)),
+            "ms_per_query": 1000 * seconds / len(queries)
+        }
+
+    baseline = results["float32"]["matches"]
+    print(f"{len(names)} catalogue vectors, {len(queries)} queries, threshold {threshold}")
+    print(f"{'dtype':8} {'index MB':>9} {'blob B':>7} {'ms/query':>9} {'recall@1':>9} "
+          f"{'verdicts':>9} {'max |ds|':>9}")
+    for dtype, result in results.items():
+        same_top = same_verdict = 0
+        max_delta = 0.0
+        for expected, actual in zip(baseline, result["matches"]):
+            same_top += expected[0][0] == actual[0][0]
+            # The verdict a lookup acts on: which ingredient (if any) clears the threshold
+            expected_match = expected[0][0] if expected[0][1] >= threshold else None
+            actual_match = actual[0][0] if actual[0][1] >= threshold else None
+            same_verdict += expected_match == actual_match
+            max_delta = max(max_delta, abs(expected[0][1] - actual[0][1]))
+        print(f"{dtype:8} {result['megabytes']:9.2f} {result['blob_bytes']:7d} "
+              f"{result['ms_per_query']:9.3f} {same_top / len(queries):9.4f} "
+              f"{same_verdict / len(queries):9.4f} {max_delta:9.5f}")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Recall@1 of float16/int8 indexes against float32")
+    parser.add_argument("--queries", help="File with one ingredient string per line (encoded with the model)")
+    parser.add_argument("--num-queries", type=int, default=2000, help="Noisy queries to generate without --queries")
+    parser.add_argument("--synthetic", type=int, help="Use this many random vectors instead of the database")
+    parser.add_argument("--threshold", type=float, default=0.85)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        rng = np.random.default_rng(1)
+        embeddings = rng.normal(size=(args.synthetic, 384)).astype(np.float32)
+        names = [f"ingredient {i}" for i in range(args.synthetic)]
+    else:
+        names, embeddings = load_catalogue()
+
+    if args.queries:
+        from scripts.databasemethods import generate_embeddings
+        with open(args.queries) as f:
+            texts = [line.strip() for line in f if line.strip()]
+        queries = generate_embeddings(texts)
+    else:
+        queries = noisy_queries(embeddings, args.num_queries)
+
+    run(names, embeddings, queries, threshold=args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -326,87 +326,349 @@
 #     clear_all_ingredients()
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 import json
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import os
+import threading
+import time
+from scripts.similarity_index import EmbeddingIndex, create_index
+from scripts.lexical_index import LexicalIndex
+from scripts.dietary_flags import FLAG_KEYS, decode_flags
+from scripts.lru_cache import LRUCache, MISSING
+from scripts.embedding_cache import EmbeddingCache
+from scripts.embedding_codec import check_dtype, decode_embedding, encode_embedding
+from scripts.embedding_backends import create_embedder, embedding_model_key
+from scripts.db_pool import get_connection, connection_params
 
 # Initialize embedding model globally (loaded once)
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
 _embedding_model = None
+_embedding_model_lock = threading.Lock()
+
+# Embedding backend: "torch" (sentence-transformers), "onnx" (same vectors on ONNX
+# Runtime) or "onnx-int8" (quantized weights; its vectors differ slightly, so switching
+# to or from it re-encodes the stored embeddings, see ensure_embeddings_current)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Which vectors this process produces (tags the caches, snapshots and stored column)
+EMBEDDING_MODEL_KEY = embedding_model_key(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND)
+# Where the ONNX export lives (written on first load if missing)
+EMBEDDING_ONNX_DIR = os.getenv(
+    "EMBEDDING_ONNX_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models", f"{EMBEDDING_MODEL_NAME}-onnx")
+)
+# ONNX Runtime intra-op threads (0 = one per core)
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+# Advisory lock id held while re-encoding stored embeddings
+EMBEDDING_REINDEX_LOCK = 72150424
+# Set once the stored embeddings are known to come from EMBEDDING_MODEL_KEY;
+# until then the index isn't loaded and no embedding is written
+_embeddings_current = False
+_embeddings_current_lock = threading.Lock()
+
+# In-memory similarity index (loaded once from the database)
+_similarity_index = None
+_similarity_index_lock = threading.Lock()
+_similarity_index_checked = 0.0
+
+# Similarity index backend: "flat" (exact) or "ivf" (approximate, for large catalogues)
+SIMILARITY_INDEX_BACKEND = os.getenv("SIMILARITY_INDEX_BACKEND", "flat")
+# Directory the index is persisted to so workers don't rebuild it on boot (unset = off)
+SIMILARITY_INDEX_PATH = os.getenv("SIMILARITY_INDEX_PATH")
+# IVF recall/latency knob: number of cells scanned per query (higher = better recall)
+SIMILARITY_INDEX_NPROBE = int(os.getenv("SIMILARITY_INDEX_NPROBE", "10"))
+# IVF cell count (unset = sqrt of the catalogue size)
+SIMILARITY_INDEX_NLIST = os.getenv("SIMILARITY_INDEX_NLIST")
+# Memory-map the persisted index read-only (shared by all workers) instead of copying it
+SIMILARITY_INDEX_MMAP = os.getenv("SIMILARITY_INDEX_MMAP", "1") == "1"
+# Vector precision held by the index: "float32", "float16" (half the memory) or
+# "int8" (per-vector scaled, about a quarter); see scripts/benchmark_quantization.py
+SIMILARITY_INDEX_DTYPE = check_dtype(os.getenv("SIMILARITY_INDEX_DTYPE", "float32"))
+# Seconds between checks for rows written by other processes (0 = never)
+SIMILARITY_INDEX_REFRESH = float(os.getenv("SIMILARITY_INDEX_REFRESH", "30"))
+# Catch-up re-reads this many generations before the last one seen, for rows
+# whose transaction committed after a later one (re-adding a row is harmless)
+SIMILARITY_INDEX_GENERATION_OVERLAP = 1000
+
+# In-process lookup caches: entries per cache (0 = off) and how long before an
+# entry is re-read, since rows added by other workers don't invalidate this one
+INGREDIENT_CACHE_SIZE = int(os.getenv("INGREDIENT_CACHE_SIZE", "10000"))
+INGREDIENT_CACHE_TTL = float(os.getenv("INGREDIENT_CACHE_TTL", "300"))
+
+# name -> (pass_mask, known_mask), or None if the name is not in the table
+_exact_cache = LRUCache(INGREDIENT_CACHE_SIZE, INGREDIENT_CACHE_TTL, name="exact")
+# (name, top_k, min_similarity) -> list of (similar_name, similarity, masks)
+_similar_cache = LRUCache(INGREDIENT_CACHE_SIZE, INGREDIENT_CACHE_TTL, name="similar")
+
+# Lexical tier: character-trigram match against the catalogue names, tried before
+# the embedding model so plurals, "organic X" and punctuation never load or run it
+LEXICAL_TIER = os.getenv("LEXICAL_TIER", "1") == "1"
+# Trigram similarity a lexical match needs; below it the lookup falls through to
+# the embedding model (see scripts/benchmark_lexical.py for hit/false-match rates)
+LEXICAL_SIMILARITY_THRESHOLD = float(os.getenv("LEXICAL_SIMILARITY_THRESHOLD", "0.85"))
+_lexical_index = None
+_lexical_index_source = None  # the similarity index it mirrors
+_lexical_index_lock = threading.Lock()
+
+# Lookups answered by each tier: exact row, lexical match, embedding match, or none
+_tier_counts = dict.fromkeys(("exact", "lexical", "semantic", "unknown"), 0)
+_tier_counts_lock = threading.Lock()
+
+# Query embeddings: vectors kept in memory, plus an optional SQLite file shared
+# by all workers and kept across restarts (unset = memory only)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "20000"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+_embedding_cache = EmbeddingCache(EMBEDDING_MODEL_KEY, EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_PATH)
+
+# Precision of newly written embedding blobs ("float32", "float16" or "int8").
+# Blobs of every precision are readable, so this can change at any time.
+EMBEDDING_STORAGE_DTYPE = check_dtype(os.getenv("EMBEDDING_STORAGE_DTYPE", "float32"))
+
+# Map filter names to database columns
+FILTER_TO_COLUMN = {
+    "vegan": "is_vegan",
+    "vegetarian": "is_vegetarian",
+    "halal": "is_halal",
+    "gluten-free": "is_gluten_free",
+    "lactose-intolerant": "is_lactose_free",
+    "nut-allergy": "is_nut_free",
+    "anti-inflammatory": "is_anti_inflammatory",
+    "low-sugar": "is_low_sugar"
+}
+
+def _mask_expression(condition):
+    """SQL for a bitmask with bit i set when `condition` holds for FLAG_KEYS[i]'s column"""
+    terms = [
+        f"(CASE WHEN {FILTER_TO_COLUMN[key]} {condition} THEN {1 << i} ELSE 0 END)"
+        for i, key in enumerate(FLAG_KEYS)
+    ]
+    return "(" + " | ".join(terms) + ")::SMALLINT"
 
 def get_embedding_model():
-    """Lazy load the embedding model"""
+    """Lazy load the embedding model (threads asking during the load wait for it)"""
     global _embedding_model
     if _embedding_model is None:
-        print("Loading embedding model (one-time setup)...")
-        _embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        with _embedding_model_lock:
+            if _embedding_model is None:
+                print(f"Loading embedding model ({EMBEDDING_BACKEND}, one-time setup)...")
+                _embedding_model = create_embedder(
+                    EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_DIR, EMBEDDING_THREADS
+                )
     return _embedding_model
 
 def connect_db():
-    """Connect to PostgreSQL database"""
-    # Get connection parameters from environment variables or use defaults
-    conn = psycopg2.connect(
-        host=os.getenv("DB_HOST", "localhost"),
-        port=os.getenv("DB_PORT", "5432"),
-        database=os.getenv("DB_NAME", "ingredients_db"),
-        user=os.getenv("DB_USER", "postgres"),
-        password=os.getenv("DB_PASSWORD", "postgres")
-    )
-    return conn
+    """
+    Open a dedicated (unpooled) PostgreSQL connection
+    
+    Query helpers use the shared pool via get_connection(); this is for
+    one-off scripts that want a connection of their own.
+    """
+    return psycopg2.connect(**connection_params())
 
 def setup_database():
     """Create tables with embedding support"""
-    conn = connect_db()
-    c = conn.cursor()
-    
-    # Enhanced ingredients table with dietary flags and embeddings
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS ingredients (
-            id SERIAL PRIMARY KEY,
-            name TEXT UNIQUE NOT NULL,
-            embedding BYTEA,
-            
-            -- Dietary restriction flags (1 = passes, 0 = fails)
-            is_vegan INTEGER DEFAULT NULL,
-            is_vegetarian INTEGER DEFAULT NULL,
-            is_halal INTEGER DEFAULT NULL,
-            is_gluten_free INTEGER DEFAULT NULL,
-            is_lactose_free INTEGER DEFAULT NULL,
-            is_nut_free INTEGER DEFAULT NULL,
-            is_anti_inflammatory INTEGER DEFAULT NULL,
-            is_low_sugar INTEGER DEFAULT NULL
-        )
-    ''')
-    
-    # Create index on name for faster lookups
-    c.execute('''
-        CREATE INDEX IF NOT EXISTS idx_ingredients_name 
-        ON ingredients(name)
-    ''')
-    
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        # Enhanced ingredients table with dietary flags and embeddings
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS ingredients (
+                id SERIAL PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL,
+                embedding BYTEA,
+                
+                -- Dietary restriction flags (1 = passes, 0 = fails)
+                is_vegan INTEGER DEFAULT NULL,
+                is_vegetarian INTEGER DEFAULT NULL,
+                is_halal INTEGER DEFAULT NULL,
+                is_gluten_free INTEGER DEFAULT NULL,
+                is_lactose_free INTEGER DEFAULT NULL,
+                is_nut_free INTEGER DEFAULT NULL,
+                is_anti_inflammatory INTEGER DEFAULT NULL,
+                is_low_sugar INTEGER DEFAULT NULL
+            )
+        ''')
+        
+        # Create index on name for faster lookups
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ingredients_name 
+            ON ingredients(name)
+        ''')
+        
+        # Compact copy of the flags (see dietary_flags), kept in sync by Postgres
+        c.execute(f'''
+            ALTER TABLE ingredients
+            ADD COLUMN IF NOT EXISTS pass_mask SMALLINT
+                GENERATED ALWAYS AS ({_mask_expression("= 1")}) STORED,
+            ADD COLUMN IF NOT EXISTS known_mask SMALLINT
+                GENERATED ALWAYS AS ({_mask_expression("IS NOT NULL")}) STORED
+        ''')
+        
+        # Which embedding model (key) the stored embeddings come from
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS embedding_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        ''')
+        
+        # Generation: bumped on every insert/update, so a process can tell
+        # whether (and which) rows changed since its similarity index was built
+        c.execute("CREATE SEQUENCE IF NOT EXISTS ingredients_generation_seq")
+        c.execute('''
+            ALTER TABLE ingredients
+            ADD COLUMN IF NOT EXISTS generation BIGINT NOT NULL
+                DEFAULT nextval('ingredients_generation_seq')
+        ''')
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ingredients_generation
+            ON ingredients(generation)
+        ''')
+        c.execute('''
+            CREATE OR REPLACE FUNCTION bump_ingredient_generation() RETURNS trigger AS $$
+            BEGIN
+                NEW.generation := nextval('ingredients_generation_seq');
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        ''')
+        c.execute('''
+            DO $$ BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'ingredients_generation') THEN
+                    CREATE TRIGGER ingredients_generation
+                    BEFORE UPDATE ON ingredients
+                    FOR EACH ROW EXECUTE FUNCTION bump_ingredient_generation();
+                END IF;
+            END $$
+        ''')
     print("Database setup complete with embedding support")
 
 def serialize_embedding(embedding_array):
-    """Convert numpy array to bytes for storage - NUMBER ARRAY to BYTES"""
-    return psycopg2.Binary(embedding_array.tobytes())
+    """Convert numpy array to bytes for storage - NUMBER ARRAY to BYTES (in EMBEDDING_STORAGE_DTYPE)"""
+    return psycopg2.Binary(encode_embedding(embedding_array, EMBEDDING_STORAGE_DTYPE))
 
 def deserialize_embedding(embedding_bytes):
-    """Convert bytes back to numpy array - BYTES to NUMBERS"""
+    """Convert bytes back to a float32 numpy array - BYTES to NUMBERS (any stored precision)"""
     if embedding_bytes is None:
         return None
     # PostgreSQL returns memoryview or bytes
-    if isinstance(embedding_bytes, memoryview):
-        embedding_bytes = embedding_bytes.tobytes()
-    return np.frombuffer(embedding_bytes, dtype=np.float32)
+    return decode_embedding(embedding_bytes)
+
+def _encode(texts, batch_size=32):
+    """Run the embedding model over a list of strings"""
+    return get_embedding_model().encode(list(texts), batch_size=batch_size)
 
 def generate_embedding(ingredient_name):
     """Generate embedding vector for an ingredient - TEXT to NUMBERS"""
-    model = get_embedding_model()
-    embedding = model.encode(ingredient_name, convert_to_numpy=True)
-    return embedding.astype(np.float32)
+    return _embedding_cache.encode([ingredient_name], _encode)[0]
+
+def generate_embeddings(ingredient_names, batch_size=32):
+    """Generate embeddings for many ingredients in one batched forward pass"""
+    return _embedding_cache.encode(
+        list(ingredient_names),
+        lambda texts: _encode(texts, batch_size=batch_size)
+    )
+
+def get_embedding_cache_stats():
+    """Hit counters for the query-embedding cache"""
+    return _embedding_cache.stats()
+
+def warm_up_embedding_model():
+    """
+    Load the embedding model and run it, so the first real lookup pays for neither
+    
+    Encodes a single string and a full batch (bypassing the embedding cache),
+    which sets up the model's thread pools and buffers for both shapes.
+    """
+    _encode(["warm-up"])
+    _encode(["warm-up ingredient"] * 32, batch_size=32)
+
+def warm_up_similarity_index():
+    """Load the similarity index and run one search (pages in a mapped index, trains IVF)"""
+    index = get_similarity_index()
+    if index.embedding_model != EMBEDDING_MODEL_KEY:
+        # Loaded (e.g. by a preloading master) before the embeddings were re-encoded
+        index = reload_similarity_index()
+    if len(index):
+        index.search(_encode(["warm-up"])[0], top_k=1)
+    if LEXICAL_TIER:
+        get_lexical_index()
+
+def stored_embedding_model():
+    """Model key of the stored embeddings (untagged tables hold torch embeddings)"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT value FROM embedding_meta WHERE key = 'model'")
+        row = c.fetchone()
+    return row[0] if row else EMBEDDING_MODEL_NAME
+
+def embeddings_current():
+    """Whether the stored embeddings match this process's EMBEDDING_MODEL_KEY (one query until they do)"""
+    global _embeddings_current
+    if not _embeddings_current and stored_embedding_model() == EMBEDDING_MODEL_KEY:
+        _embeddings_current = True
+    return _embeddings_current
+
+def require_current_embeddings():
+    """
+    Make sure the stored embeddings match EMBEDDING_MODEL_KEY, re-encoding them now if not
+    
+    Called before the similarity index is loaded and before embeddings are
+    written, so a worker whose warm-up was skipped or failed never scores
+    or stores vectors of one model against another's. Raises if the
+    re-encode fails; the next call tries again.
+    """
+    if _embeddings_current:
+        return
+    with _embeddings_current_lock:
+        if not _embeddings_current:
+            ensure_embeddings_current()
+
+def ensure_embeddings_current(batch_size=256):
+    """
+    Re-encode stored embeddings that came from a different embedding model key
+    
+    Runs in one transaction under an advisory lock: when several workers start
+    with a new EMBEDDING_BACKEND, one re-encodes and the others wait, then find
+    the table current. Untagged tables hold torch embeddings.
+    
+    Returns: Number of embeddings re-encoded (0 if already current)
+    """
+    global _embeddings_current
+    start = time.perf_counter()
+    reencoded = 0
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT pg_advisory_xact_lock(%s)", (EMBEDDING_REINDEX_LOCK,))
+        c.execute("SELECT value FROM embedding_meta WHERE key = 'model'")
+        row = c.fetchone()
+        stored = row[0] if row else EMBEDDING_MODEL_NAME
+        if stored != EMBEDDING_MODEL_KEY:
+            print(f"Re-encoding stored embeddings: {stored} -> {EMBEDDING_MODEL_KEY}")
+            c.execute("SELECT id, name FROM ingredients WHERE embedding IS NOT NULL ORDER BY id")
+            rows = c.fetchall()
+            for i in range(0, len(rows), batch_size):
+                chunk = rows[i:i + batch_size]
+                embeddings = _encode([name for _, name in chunk], batch_size=64)
+                execute_values(c, '''
+                    UPDATE ingredients SET embedding = data.embedding
+                    FROM (VALUES %s) AS data (id, embedding)
+                    WHERE ingredients.id = data.id
+                ''', [(row_id, serialize_embedding(embedding)) for (row_id, _), embedding in zip(chunk, embeddings)])
+            reencoded = len(rows)
+        if row is None or stored != EMBEDDING_MODEL_KEY:
+            c.execute('''
+                INSERT INTO embedding_meta (key, value) VALUES ('model', %s)
+                ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+            ''', (EMBEDDING_MODEL_KEY,))
+    _embeddings_current = True
+    
+    if reencoded:
+        print(f"Re-encoded {reencoded} embeddings in {time.perf_counter() - start:.2f}s")
+        invalidate_lookup_caches()
+        if _similarity_index is not None:
+            reload_similarity_index()
+    return reencoded
 
 def cosine_similarity(vec1, vec2):
     """Calculate similarity between two vectors (0-1, higher = more similar)"""
@@ -415,6 +677,265 @@ def cosine_similarity(vec1, vec2):
     norm2 = np.linalg.norm(vec2)
     return dot_product / (norm1 * norm2)
 
+def row_to_properties(row):
+    """Convert a database row (dict-like) into a dietary flags dict"""
+    return {
+        filter_name: row[column_name]
+        for filter_name, column_name in FILTER_TO_COLUMN.items()
+    }
+
+def row_to_masks(row):
+    """(pass_mask, known_mask) of a database row selecting both mask columns"""
+    return row["pass_mask"], row["known_mask"]
+
+def _index_options():
+    """Constructor options for the configured index backend"""
+    if SIMILARITY_INDEX_BACKEND == "ivf":
+        return {
+            "dtype": SIMILARITY_INDEX_DTYPE,
+            "nprobe": SIMILARITY_INDEX_NPROBE,
+            "nlist": int(SIMILARITY_INDEX_NLIST) if SIMILARITY_INDEX_NLIST else None
+        }
+    return {"dtype": SIMILARITY_INDEX_DTYPE}
+
+def _fetch_index_rows(names=None, since=None):
+    """Fetch name, embedding, flag masks and generation for all (or the given, or changed) ingredients"""
+    query = """
+        SELECT name, embedding, pass_mask, known_mask, generation
+        FROM ingredients 
+        WHERE embedding IS NOT NULL
+    """
+    with get_connection() as conn:
+        c = conn.cursor(cursor_factory=RealDictCursor)
+        if names is not None:
+            c.execute(query + " AND name = ANY(%s)", (list(names),))
+        elif since is not None:
+            c.execute(query + " AND generation > %s", (since,))
+        else:
+            c.execute(query)
+        return c.fetchall()
+
+def _database_generation():
+    """(latest generation, number of rows with an embedding, embedding model key) of the ingredients table"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT COALESCE(max(generation), 0), count(embedding),
+                   (SELECT value FROM embedding_meta WHERE key = 'model')
+            FROM ingredients
+        """)
+        generation, count, embedding_model = c.fetchone()
+    # Untagged tables predate the backends and hold torch embeddings
+    return generation, count, embedding_model or EMBEDDING_MODEL_NAME
+
+def _add_rows_to_index(index, rows):
+    index.add_many(
+        [row["name"] for row in rows],
+        [deserialize_embedding(row["embedding"]) for row in rows],
+        masks=([row["pass_mask"] for row in rows], [row["known_mask"] for row in rows])
+    )
+    if rows:
+        index.generation = max(index.generation, max(row["generation"] for row in rows))
+
+def _catch_up_index(index, generation, count, embedding_model):
+    """
+    Add rows written since the index's generation
+    
+    Returns False if the index can't be caught up (rows were deleted, the
+    table was reset behind it, or its embeddings were re-encoded) and has
+    to be rebuilt.
+    """
+    if index.generation > generation or index.embedding_model != embedding_model:
+        return False
+    if index.generation < generation:
+        since = max(0, index.generation - SIMILARITY_INDEX_GENERATION_OVERLAP)
+        rows = _fetch_index_rows(since=since)
+        _add_rows_to_index(index, rows)
+        index.generation = max(index.generation, generation)
+    return len(index) == count
+
+def _load_persisted_index():
+    """
+    Load the on-disk index and catch it up with rows written since it was saved
+
+    The snapshot records the table generation it was built at: if that is
+    still current, nothing is read from the database beyond one aggregate.
+    Returns None if there is no usable snapshot (missing, different backend,
+    or it holds ingredients that are no longer in the table).
+    """
+    if not SIMILARITY_INDEX_PATH or not os.path.exists(SIMILARITY_INDEX_PATH):
+        return None
+    try:
+        index = EmbeddingIndex.load(SIMILARITY_INDEX_PATH, mmap=SIMILARITY_INDEX_MMAP, **_index_options())
+    except Exception as e:
+        print(f"Could not load similarity index from {SIMILARITY_INDEX_PATH}: {e}")
+        return None
+    if (index.backend != SIMILARITY_INDEX_BACKEND or index.flag_keys != FLAG_KEYS
+            or index.dtype != SIMILARITY_INDEX_DTYPE):
+        return None
+    index.embedding_model = index.embedding_model or EMBEDDING_MODEL_NAME
+    
+    snapshot_generation = index.generation
+    if not _catch_up_index(index, *_database_generation()):
+        return None
+    if index.generation != snapshot_generation:
+        print(f"Caught up similarity index from generation {snapshot_generation} to {index.generation}")
+        save_similarity_index(index)
+    return index
+
+def load_similarity_index():
+    """Build the in-memory similarity index (from disk if persisted, else from the table)"""
+    require_current_embeddings()
+    index = _load_persisted_index()
+    if index is None:
+        index = create_index(FLAG_KEYS, SIMILARITY_INDEX_BACKEND, **_index_options())
+        index.embedding_model = _database_generation()[2]
+        _add_rows_to_index(index, _fetch_index_rows())
+        save_similarity_index(index)
+        if SIMILARITY_INDEX_PATH and SIMILARITY_INDEX_MMAP:
+            # Swap the freshly built arrays for the shared mapping of what was just saved
+            index = _load_persisted_index() or index
+    print(f"Loaded {index.backend} similarity index with {len(index)} ingredients "
+          f"({index.dtype}, {index.nbytes() / 1e6:.1f} MB, generation {index.generation})")
+    return index
+
+def save_similarity_index(index=None):
+    """Persist the similarity index to SIMILARITY_INDEX_PATH"""
+    index = index or _similarity_index
+    if not SIMILARITY_INDEX_PATH or index is None:
+        return
+    try:
+        index.save(SIMILARITY_INDEX_PATH)
+    except OSError as e:
+        print(f"Could not save similarity index to {SIMILARITY_INDEX_PATH}: {e}")
+
+def get_similarity_index():
+    """
+    Lazy load the similarity index (shared by every thread in the process)
+    
+    Every SIMILARITY_INDEX_REFRESH seconds the table generation is checked,
+    and rows written by other processes are added (or the index rebuilt if
+    rows were deleted).
+    """
+    global _similarity_index, _similarity_index_checked
+    if _similarity_index is None:
+        with _similarity_index_lock:
+            if _similarity_index is None:
+                _similarity_index = load_similarity_index()
+                _similarity_index_checked = time.monotonic()
+        return _similarity_index
+    
+    if SIMILARITY_INDEX_REFRESH and time.monotonic() - _similarity_index_checked >= SIMILARITY_INDEX_REFRESH:
+        if _similarity_index_lock.acquire(blocking=False):
+            try:
+                _similarity_index_checked = time.monotonic()
+                refresh_similarity_index()
+            except Exception as e:
+                print(f"Similarity index refresh failed: {e}")
+            finally:
+                _similarity_index_lock.release()
+    return _similarity_index
+
+def refresh_similarity_index():
+    """Bring the loaded index up to the table's current generation"""
+    global _similarity_index
+    index = _similarity_index
+    if index is None:
+        return
+    generation, count, embedding_model = _database_generation()
+    if generation == index.generation and len(index) == count and embedding_model == index.embedding_model:
+        return
+    before = index.generation
+    if _catch_up_index(index, generation, count, embedding_model):
+        print(f"Refreshed similarity index from generation {before} to {index.generation}")
+    else:
+        _similarity_index = load_similarity_index()
+    _similar_cache.clear()
+
+def reload_similarity_index():
+    """Rebuild the similarity index from the database"""
+    global _similarity_index
+    index = load_similarity_index()
+    with _similarity_index_lock:
+        _similarity_index = index
+    _similar_cache.clear()
+    return index
+
+def get_lexical_index():
+    """
+    Lexical index over the similarity index's names (no embedding model needed)
+    
+    Built on first use and extended with the rows the similarity index has
+    gained since the last call; rebuilt when that index is replaced.
+    """
+    global _lexical_index, _lexical_index_source
+    index = get_similarity_index()
+    lexical = _lexical_index
+    if lexical is not None and _lexical_index_source is index and len(lexical) == len(index):
+        return lexical
+    with _lexical_index_lock:
+        lexical = _lexical_index
+        if lexical is None or _lexical_index_source is not index or len(lexical) > len(index):
+            lexical = LexicalIndex()
+        # Rows are only ever appended to an index, so the new names are its tail
+        lexical.add_many(index.names(start=len(lexical)))
+        _lexical_index, _lexical_index_source = lexical, index
+    return lexical
+
+def find_lexical_match(ingredient_name, min_similarity=None):
+    """
+    Best trigram match for a name in the catalogue, if it is close enough
+    
+    Returns: (ingredient_name, similarity, (pass_mask, known_mask)), or None
+    """
+    if min_similarity is None:
+        min_similarity = LEXICAL_SIMILARITY_THRESHOLD
+    lexical = get_lexical_index()
+    matches = lexical.search(ingredient_name.lower(), top_k=1, min_similarity=min_similarity)
+    if not matches:
+        return None
+    name, similarity = matches[0]
+    masks = _lexical_index_source.masks(name)
+    return (name, similarity, masks) if masks else None
+
+def _count_tier(tier, count=1):
+    with _tier_counts_lock:
+        _tier_counts[tier] += count
+
+def get_lookup_tier_stats():
+    """How many lookups each tier answered (exact, lexical, semantic, unknown)"""
+    with _tier_counts_lock:
+        counts = dict(_tier_counts)
+    misses = counts["lexical"] + counts["semantic"] + counts["unknown"]
+    return {
+        **counts,
+        # Share of non-exact lookups answered without the embedding model
+        "lexical_hit_rate": round(counts["lexical"] / misses, 4) if misses else None,
+        "lexical_enabled": LEXICAL_TIER,
+        "lexical_threshold": LEXICAL_SIMILARITY_THRESHOLD,
+        "lexical_names": len(_lexical_index) if _lexical_index is not None else 0
+    }
+
+def invalidate_lookup_caches(ingredient_name=None):
+    """
+    Drop cached lookups after the table changed
+    
+    Any write can change the nearest neighbour of any query, so similarity
+    results are always dropped; exact results only for the changed name.
+    """
+    if ingredient_name is None:
+        _exact_cache.clear()
+    else:
+        _exact_cache.invalidate(ingredient_name.lower())
+    _similar_cache.clear()
+
+def get_lookup_cache_stats():
+    """Hit-rate counters for the exact and similarity lookup caches"""
+    return {
+        "exact": _exact_cache.stats(),
+        "similar": _similar_cache.stats()
+    }
+
 def add_ingredient(ingredient_name, dietary_flags, confidence=1.0):
     """
     Add ingredient with dietary flags and auto-generated embedding
@@ -434,89 +955,138 @@ def add_ingredient(ingredient_name, dietary_flags, confidence=1.0):
                       }
         confidence: How confident we are (0-1)
     """
-    conn = connect_db()
-    c = conn.cursor()
-    
-    # Generate embedding
+    # Generate embedding (the stored ones must come from the same model)
+    require_current_embeddings()
     embedding = generate_embedding(ingredient_name)
     embedding_blob = serialize_embedding(embedding)
     
-    # Map filter names to database columns
-    filter_to_column = {
-        "vegan": "is_vegan",
-        "vegetarian": "is_vegetarian",
-        "halal": "is_halal",
-        "gluten-free": "is_gluten_free",
-        "lactose-intolerant": "is_lactose_free",
-        "nut-allergy": "is_nut_free",
-        "anti-inflammatory": "is_anti_inflammatory",
-        "low-sugar": "is_low_sugar"
-    }
-    
     # Convert dietary_flags to column values
     column_values = {}
-    for filter_name, column_name in filter_to_column.items():
+    for filter_name, column_name in FILTER_TO_COLUMN.items():
         if filter_name in dietary_flags:
             # If ingredient fails filter, store 0; if passes, store 1
             column_values[column_name] = dietary_flags[filter_name]
     
     # PostgreSQL uses ON CONFLICT for upsert
-    c.execute('''
-        INSERT INTO ingredients 
-        (name, embedding, is_vegan, is_vegetarian, is_halal, is_gluten_free,
-         is_lactose_free, is_nut_free, is_anti_inflammatory, is_low_sugar)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (name) DO UPDATE SET
-            embedding = EXCLUDED.embedding,
-            is_vegan = EXCLUDED.is_vegan,
-            is_vegetarian = EXCLUDED.is_vegetarian,
-            is_halal = EXCLUDED.is_halal,
-            is_gluten_free = EXCLUDED.is_gluten_free,
-            is_lactose_free = EXCLUDED.is_lactose_free,
-            is_nut_free = EXCLUDED.is_nut_free,
-            is_anti_inflammatory = EXCLUDED.is_anti_inflammatory,
-            is_low_sugar = EXCLUDED.is_low_sugar
-    ''', (
-        ingredient_name.lower(),
-        embedding_blob,
-        column_values.get("is_vegan"),
-        column_values.get("is_vegetarian"),
-        column_values.get("is_halal"),
-        column_values.get("is_gluten_free"),
-        column_values.get("is_lactose_free"),
-        column_values.get("is_nut_free"),
-        column_values.get("is_anti_inflammatory"),
-        column_values.get("is_low_sugar")
-    ))
-    
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute('''
+            INSERT INTO ingredients 
+            (name, embedding, is_vegan, is_vegetarian, is_halal, is_gluten_free,
+             is_lactose_free, is_nut_free, is_anti_inflammatory, is_low_sugar)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (name) DO UPDATE SET
+                embedding = EXCLUDED.embedding,
+                is_vegan = EXCLUDED.is_vegan,
+                is_vegetarian = EXCLUDED.is_vegetarian,
+                is_halal = EXCLUDED.is_halal,
+                is_gluten_free = EXCLUDED.is_gluten_free,
+                is_lactose_free = EXCLUDED.is_lactose_free,
+                is_nut_free = EXCLUDED.is_nut_free,
+                is_anti_inflammatory = EXCLUDED.is_anti_inflammatory,
+                is_low_sugar = EXCLUDED.is_low_sugar
+        ''', (
+            ingredient_name.lower(),
+            embedding_blob,
+            column_values.get("is_vegan"),
+            column_values.get("is_vegetarian"),
+            column_values.get("is_halal"),
+            column_values.get("is_gluten_free"),
+            column_values.get("is_lactose_free"),
+            column_values.get("is_nut_free"),
+            column_values.get("is_anti_inflammatory"),
+            column_values.get("is_low_sugar")
+        ))
+    
+    # Keep the in-memory index in step with the table
+    if _similarity_index is not None:
+        properties = {
+            filter_name: column_values.get(column_name)
+            for filter_name, column_name in FILTER_TO_COLUMN.items()
+        }
+        _similarity_index.add(ingredient_name.lower(), embedding, properties)
+    invalidate_lookup_caches(ingredient_name)
+
+def add_ingredients(ingredients, batch_size=64):
+    """
+    Bulk version of add_ingredient
+    
+    Encodes every name in batches of batch_size and upserts all rows in one
+    transaction, instead of one model call and one commit per ingredient.
+    
+    Args:
+        ingredients: Dict of {ingredient_name: dietary_flags}
+        batch_size: Names per embedding-model forward pass
+    
+    Returns: Dict with rows written, seconds taken and rows_per_second
+    """
+    start = time.perf_counter()
+    
+    # Last entry wins for names differing only in case (one upsert can't touch a row twice)
+    flags_by_name = {name.lower(): flags for name, flags in ingredients.items()}
+    names = list(flags_by_name)
+    if not names:
+        return {"rows": 0, "seconds": 0.0, "rows_per_second": 0.0}
+    
+    require_current_embeddings()
+    embeddings = generate_embeddings(names, batch_size=batch_size)
+    rows = [
+        (name, serialize_embedding(embedding),
+         *[flags_by_name[name].get(filter_name) for filter_name in FILTER_TO_COLUMN])
+        for name, embedding in zip(names, embeddings)
+    ]
+    
+    with get_connection() as conn:
+        c = conn.cursor()
+        execute_values(c, '''
+            INSERT INTO ingredients 
+            (name, embedding, is_vegan, is_vegetarian, is_halal, is_gluten_free,
+             is_lactose_free, is_nut_free, is_anti_inflammatory, is_low_sugar)
+            VALUES %s
+            ON CONFLICT (name) DO UPDATE SET
+                embedding = EXCLUDED.embedding,
+                is_vegan = EXCLUDED.is_vegan,
+                is_vegetarian = EXCLUDED.is_vegetarian,
+                is_halal = EXCLUDED.is_halal,
+                is_gluten_free = EXCLUDED.is_gluten_free,
+                is_lactose_free = EXCLUDED.is_lactose_free,
+                is_nut_free = EXCLUDED.is_nut_free,
+                is_anti_inflammatory = EXCLUDED.is_anti_inflammatory,
+                is_low_sugar = EXCLUDED.is_low_sugar
+        ''', rows, page_size=500)
+    
+    # Keep the in-memory index in step with the table
+    if _similarity_index is not None:
+        _similarity_index.add_many(names, embeddings, [flags_by_name[name] for name in names])
+    for name in names:
+        _exact_cache.invalidate(name)
+    _similar_cache.clear()
+    
+    seconds = time.perf_counter() - start
+    rate = len(names) / seconds if seconds > 0 else float("inf")
+    print(f"Added {len(names)} ingredients in {seconds:.2f}s ({rate:.0f} rows/s)")
+    return {"rows": len(names), "seconds": round(seconds, 3), "rows_per_second": round(rate, 1)}
 
 def get_ingredient_properties(ingredient_name):
     """Get dietary flags for an exact match"""
-    conn = connect_db()
-    c = conn.cursor(cursor_factory=RealDictCursor)
-    c.execute("""
-        SELECT is_vegan, is_vegetarian, is_halal, is_gluten_free,
-               is_lactose_free, is_nut_free, is_anti_inflammatory, 
-               is_low_sugar
-        FROM ingredients 
-        WHERE name = %s
-    """, (ingredient_name.lower(),))
-    row = c.fetchone()
-    conn.close()
+    name = ingredient_name.lower()
+    masks = _exact_cache.get(name)
+    if masks is MISSING:
+        # Not cached if add_ingredient invalidates the name while we read it
+        generation = _exact_cache.generation
+        with get_connection() as conn:
+            c = conn.cursor(cursor_factory=RealDictCursor)
+            c.execute("""
+                SELECT pass_mask, known_mask
+                FROM ingredients 
+                WHERE name = %s
+            """, (name,))
+            row = c.fetchone()
+        masks = row_to_masks(row) if row else None
+        _exact_cache.put(name, masks, generation)
     
-    if row:
-        return {
-            "vegan": row["is_vegan"],
-            "vegetarian": row["is_vegetarian"],
-            "halal": row["is_halal"],
-            "gluten-free": row["is_gluten_free"],
-            "lactose-intolerant": row["is_lactose_free"],
-            "nut-allergy": row["is_nut_free"],
-            "anti-inflammatory": row["is_anti_inflammatory"],
-            "low-sugar": row["is_low_sugar"]
-        }
+    if masks:
+        return decode_flags(*masks)
     return None
 
 def find_similar_ingredients(ingredient_name, top_k=5, min_similarity=0.80):
@@ -525,59 +1095,48 @@ def find_similar_ingredients(ingredient_name, top_k=5, min_similarity=0.80):
     
     Returns: List of (ingredient_name, similarity_score, properties) tuples
     """
-    conn = connect_db()
-    c = conn.cursor(cursor_factory=RealDictCursor)
-    
-    # Generate embedding for query ingredient
-    query_embedding = generate_embedding(ingredient_name)
-    
-    # Get all ingredients with embeddings
-    c.execute("""
-        SELECT name, embedding, is_vegan, is_vegetarian, is_halal, 
-               is_gluten_free, is_lactose_free, is_nut_free, 
-               is_anti_inflammatory, is_low_sugar
-        FROM ingredients 
-        WHERE embedding IS NOT NULL
-    """)
-    
-    similarities = []
-    for row in c.fetchall():
-        stored_embedding = deserialize_embedding(row["embedding"])
-        similarity = cosine_similarity(query_embedding, stored_embedding)
+    key = (ingredient_name.lower(), top_k, min_similarity)
+    matches = _similar_cache.get(key)
+    if matches is MISSING:
+        generation = _similar_cache.generation
+        index = get_similarity_index()
+        
+        # Generate embedding for query ingredient
+        query_embedding = generate_embedding(ingredient_name)
         
-        if similarity >= min_similarity:
-            properties = {
-                "vegan": row["is_vegan"],
-                "vegetarian": row["is_vegetarian"],
-                "halal": row["is_halal"],
-                "gluten-free": row["is_gluten_free"],
-                "lactose-intolerant": row["is_lactose_free"],
-                "nut-allergy": row["is_nut_free"],
-                "anti-inflammatory": row["is_anti_inflammatory"],
-                "low-sugar": row["is_low_sugar"]
-            }
-            similarities.append((row["name"], similarity, properties))
-    
-    conn.close()
-    
-    # Sort by similarity and return top_k
-    similarities.sort(key=lambda x: x[1], reverse=True)
-    return similarities[:top_k]
+        matches = index.search(query_embedding, top_k=top_k, min_similarity=min_similarity, decode=False)
+        _similar_cache.put(key, matches, generation)
+    
+    return [(name, similarity, decode_flags(*masks)) for name, similarity, masks in matches]
 
 def get_or_infer_properties(ingredient_name, similarity_threshold=0.85):
     """
     Get ingredient properties with fallback to similarity search
     
+    Tiers, cheapest first: exact row, trigram match on the name (at
+    LEXICAL_SIMILARITY_THRESHOLD), then embedding similarity (at
+    similarity_threshold).
+    
     Returns: (properties_dict, source)
         - properties_dict: Dietary flags
-        - source: "exact" | "similar:<ingredient>" | "unknown"
+        - source: "exact" | "lexical:<ingredient>" | "similar:<ingredient>" | "unknown"
     """
     # Try exact match first
     properties = get_ingredient_properties(ingredient_name)
     if properties:
         print(properties)
+        _count_tier("exact")
         return properties, "exact"
     
+    # Try a lexical match (no embedding model involved)
+    if LEXICAL_TIER:
+        match = find_lexical_match(ingredient_name)
+        if match:
+            lexical_name, similarity, masks = match
+            print(f"  → Matched '{lexical_name}' lexically (similarity: {similarity:.2f})")
+            _count_tier("lexical")
+            return decode_flags(*masks), f"lexical:{lexical_name}"
+    
     # Try similarity search
     similar = find_similar_ingredients(ingredient_name, top_k=1, 
                                       min_similarity=similarity_threshold)
@@ -585,24 +1144,104 @@ def get_or_infer_properties(ingredient_name, similarity_threshold=0.85):
     if similar:
         similar_name, similarity, similar_properties = similar[0]
         print(f"  → Inferred from '{similar_name}' (similarity: {similarity:.2f})")
+        _count_tier("semantic")
         return similar_properties, f"similar:{similar_name}"
     
     # Unknown ingredient
+    _count_tier("unknown")
     return None, "unknown"
 
+def resolve_ingredients(ingredient_names, similarity_threshold=0.85, decode=True):
+    """
+    Resolve a whole label's ingredients at once
+    
+    Exact matches are fetched with a single query, then misses are tried
+    against the lexical tier, and whatever is left is encoded in one batched
+    model call and scored against the similarity index together. Exact and
+    similarity results are served from the lookup caches first.
+    
+    Returns: List of (properties_dict, source) tuples, parallel to ingredient_names
+        - properties_dict: With decode=False, the raw (pass_mask, known_mask)
+          pair instead (see dietary_flags)
+        - source: "exact" | "lexical:<ingredient>" | "similar:<ingredient>" | "unknown"
+    """
+    names = [name.lower() for name in ingredient_names]
+    unique_names = list(dict.fromkeys(names))
+    resolved = {}
+    
+    exact = _exact_cache.get_many(unique_names)
+    uncached = [name for name in unique_names if name not in exact]
+    if uncached:
+        # Not cached if add_ingredient invalidates a name while we read it
+        generation = _exact_cache.generation
+        with get_connection() as conn:
+            c = conn.cursor(cursor_factory=RealDictCursor)
+            c.execute("""
+                SELECT name, pass_mask, known_mask
+                FROM ingredients 
+                WHERE name = ANY(%s)
+            """, (uncached,))
+            rows = c.fetchall()
+        fetched = dict.fromkeys(uncached)
+        fetched.update((row["name"], row_to_masks(row)) for row in rows)
+        _exact_cache.put_many(fetched, generation)
+        exact.update(fetched)
+    for name, masks in exact.items():
+        if masks is not None:
+            resolved[name] = (masks, "exact")
+    _count_tier("exact", len(resolved))
+    
+    misses = [name for name in unique_names if name not in resolved]
+    if LEXICAL_TIER and misses:
+        for name in misses:
+            match = find_lexical_match(name)
+            if match:
+                lexical_name, similarity, masks = match
+                print(f"  → Matched '{name}' to '{lexical_name}' lexically (similarity: {similarity:.2f})")
+                resolved[name] = (masks, f"lexical:{lexical_name}")
+                _count_tier("lexical")
+        misses = [name for name in misses if name not in resolved]
+    similar = _similar_cache.get_many([(name, 1, similarity_threshold) for name in misses])
+    uncached = [name for name in misses if (name, 1, similarity_threshold) not in similar]
+    if uncached:
+        generation = _similar_cache.generation
+        index = get_similarity_index()
+        query_embeddings = generate_embeddings(uncached)
+        matches = index.search_many(query_embeddings, top_k=1,
+                                    min_similarity=similarity_threshold, decode=False)
+        fetched = {(name, 1, similarity_threshold): match for name, match in zip(uncached, matches)}
+        _similar_cache.put_many(fetched, generation)
+        similar.update(fetched)
+    for name in misses:
+        match = similar[(name, 1, similarity_threshold)]
+        if match:
+            similar_name, similarity, masks = match[0]
+            print(f"  → Inferred '{name}' from '{similar_name}' (similarity: {similarity:.2f})")
+            resolved[name] = (masks, f"similar:{similar_name}")
+            _count_tier("semantic")
+        else:
+            resolved[name] = (None, "unknown")
+            _count_tier("unknown")
+    
+    if decode:
+        return [
+            (decode_flags(*masks) if masks else None, source)
+            for masks, source in (resolved[name] for name in names)
+        ]
+    return [resolved[name] for name in names]
+
 def view_all_ingredients():
     """Display all ingredients and their dietary properties"""
-    conn = connect_db()
-    c = conn.cursor(cursor_factory=RealDictCursor)
-    c.execute("""
-        SELECT name, is_vegan, is_vegetarian, is_halal, is_gluten_free,
-               is_lactose_free, is_nut_free, is_anti_inflammatory, 
-               is_low_sugar
-        FROM ingredients 
-        ORDER BY name
-    """)
-    rows = c.fetchall()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor(cursor_factory=RealDictCursor)
+        c.execute("""
+            SELECT name, is_vegan, is_vegetarian, is_halal, is_gluten_free,
+                   is_lactose_free, is_nut_free, is_anti_inflammatory, 
+                   is_low_sugar
+            FROM ingredients 
+            ORDER BY name
+        """)
+        rows = c.fetchall()
     
     if not rows:
         print("Database is empty - no ingredients found.")
@@ -631,12 +1270,15 @@ def view_all_ingredients():
 
 def clear_all_ingredients():
     """Delete all ingredients from the database"""
-    conn = connect_db()
-    c = conn.cursor()
-    c.execute("DELETE FROM ingredients")
-    conn.commit()
-    rows_deleted = c.rowcount
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM ingredients")
+        rows_deleted = c.rowcount
+    global _lexical_index
+    if _similarity_index is not None:
+        _similarity_index.clear()
+    _lexical_index = None
+    invalidate_lookup_caches()
     print(f"Cleared {rows_deleted} ingredient(s) from the database.")
     return rows_deleted
 
@@ -656,10 +1298,11 @@ def preload_database(json_path="data/preload.json"):
         data = json.load(f)
     
     print(f"Preloading {len(data)} ingredients...")
-    for ingredient_name, dietary_flags in data.items():
-        add_ingredient(ingredient_name, dietary_flags)
+    report = add_ingredients(data)
     
-    print(f"Preloaded {len(data)} ingredients with embeddings")
+    print(f"Preloaded {report['rows']} ingredients with embeddings "
+          f"({report['rows_per_second']:.0f} rows/s)")
+    return report
 
 # Legacy function for backward compatibility
 def get_tags(ingredient_name):
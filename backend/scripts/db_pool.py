@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions, pool
+
+# Pool sizing (shared by Flask request threads and background analysis threads)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Seconds a caller waits for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Connections idle longer than this are pinged before being handed out
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "30"))
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = None  # bounds concurrent checkouts so callers wait instead of erroring
+_last_used = {}  # id(conn) -> time it was returned to the pool
+_counts_lock = threading.Lock()
+_counts = {"in_use": 0, "peak_in_use": 0, "timeouts": 0}
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within DB_POOL_TIMEOUT"""
+
+
+def connection_params():
+    """Connection parameters from environment variables (or defaults)"""
+    return {
+        "host": os.getenv("DB_HOST", "localhost"),
+        "port": os.getenv("DB_PORT", "5432"),
+        "database": os.getenv("DB_NAME", "ingredients_db"),
+        "user": os.getenv("DB_USER", "postgres"),
+        "password": os.getenv("DB_PASSWORD", "postgres")
+    }
+
+
+def init_db_pool(minconn=None, maxconn=None):
+    """(Re)create the process-wide connection pool"""
+    global _pool, _slots
+    minconn = DB_POOL_MIN if minconn is None else minconn
+    maxconn = DB_POOL_MAX if maxconn is None else maxconn
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+        _last_used.clear()
+        _pool = pool.ThreadedConnectionPool(minconn, maxconn, **connection_params())
+        _slots = threading.BoundedSemaphore(maxconn)
+    print(f"Database pool ready ({minconn}-{maxconn} connections)")
+    return _pool
+
+
+def get_db_pool():
+    """Lazy create the pool on first use"""
+    if _pool is None:
+        init_db_pool()
+    return _pool
+
+
+def close_db_pool():
+    """Close every pooled connection (call on process shutdown)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+        _last_used.clear()
+
+
+def _is_usable(conn):
+    """Cheap liveness check; only round-trips if the connection sat idle"""
+    if conn.closed:
+        return False
+    if conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < DB_POOL_PING_AFTER:
+        return True
+    try:
+        with conn.cursor() as c:
+            c.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout(db_pool):
+    """Borrow a live connection, replacing dead ones"""
+    for _ in range(3):
+        conn = db_pool.getconn()
+        if _is_usable(conn):
+            return conn
+        _last_used.pop(id(conn), None)
+        db_pool.putconn(conn, close=True)
+    return db_pool.getconn()
+
+
+@contextmanager
+def get_connection():
+    """
+    Borrow a pooled connection for the duration of a with-block
+
+    Commits when the block finishes and rolls back if it raises. Connections
+    that broke mid-use are discarded instead of going back into the pool.
+
+    Usage:
+        with get_connection() as conn:
+            c = conn.cursor()
+            c.execute(...)
+    """
+    db_pool = get_db_pool()
+    slots = _slots
+    if not slots.acquire(timeout=DB_POOL_TIMEOUT):
+        with _counts_lock:
+            _counts["timeouts"] += 1
+        raise PoolTimeout(f"No database connection free after {DB_POOL_TIMEOUT}s")
+    with _counts_lock:
+        _counts["in_use"] += 1
+        _counts["peak_in_use"] = max(_counts["peak_in_use"], _counts["in_use"])
+
+    conn = None
+    discard = False
+    try:
+        conn = _checkout(db_pool)
+        yield conn
+        conn.commit()
+    except Exception as e:
+        if conn is None or conn.closed or isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+            discard = True
+        else:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        raise
+    finally:
+        if conn is not None:
+            if discard:
+                _last_used.pop(id(conn), None)
+            else:
+                _last_used[id(conn)] = time.monotonic()
+            db_pool.putconn(conn, close=discard)
+        with _counts_lock:
+            _counts["in_use"] -= 1
+        slots.release()
+
+
+def check_database_health():
+    """Return True if a pooled connection can run a query"""
+    try:
+        with get_connection() as conn:
+            c = conn.cursor()
+            c.execute("SELECT 1")
+            c.close()
+        return True
+    except Exception as e:
+        print(f"Database health check failed: {e}")
+        return False
+
+
+def pool_stats():
+    """Pool sizing, connections borrowed right now (and at peak), and checkout timeouts"""
+    with _counts_lock:
+        counts = dict(_counts)
+    if _pool is None:
+        return {"initialized": False, **counts}
+    return {"initialized": True, "min": _pool.minconn, "max": _pool.maxconn, **counts}
@@ -0,0 +1,87 @@
+import numpy as np
+
+# Bit order of the dietary masks: bit i is FLAG_KEYS[i]
+FLAG_KEYS = (
+    "vegan",
+    "vegetarian",
+    "halal",
+    "gluten-free",
+    "lactose-intolerant",
+    "nut-allergy",
+    "anti-inflammatory",
+    "low-sugar"
+)
+
+
+def flag_bits(flag_keys=FLAG_KEYS):
+    """Map each flag name to its bit"""
+    return {key: 1 << i for i, key in enumerate(flag_keys)}
+
+
+def mask_dtype(flag_keys=FLAG_KEYS):
+    """Smallest unsigned integer type holding one bit per flag"""
+    return np.uint8 if len(flag_keys) <= 8 else np.uint16
+
+
+def encode_flags(properties, flag_keys=FLAG_KEYS):
+    """
+    Pack a dietary flags dict into (pass_mask, known_mask)
+
+    A bit set in known_mask means the flag is known (not NULL); the same
+    bit in pass_mask says the ingredient passes it. Missing keys and None
+    are unknown.
+    """
+    pass_mask = 0
+    known_mask = 0
+    if properties:
+        for key, bit in flag_bits(flag_keys).items():
+            value = properties.get(key)
+            if value is not None:
+                known_mask |= bit
+                if int(value):
+                    pass_mask |= bit
+    return pass_mask, known_mask
+
+
+def decode_flags(pass_mask, known_mask, flag_keys=FLAG_KEYS):
+    """Unpack masks into a dietary flags dict (1 = passes, 0 = fails, None = unknown)"""
+    return {
+        key: (1 if pass_mask & bit else 0) if known_mask & bit else None
+        for key, bit in flag_bits(flag_keys).items()
+    }
+
+
+def compile_filters(user_filters, flag_keys=FLAG_KEYS):
+    """OR the bits of the requested filters (names without a bit can never fail)"""
+    bits = flag_bits(flag_keys)
+    mask = 0
+    for filter_name in user_filters:
+        mask |= bits.get(filter_name, 0)
+    return mask
+
+
+def failing_bits(pass_masks, known_masks, filter_mask):
+    """Per ingredient, the bits of the compiled filters it is known to fail"""
+    pass_masks = np.asarray(pass_masks, dtype=np.uint16)
+    known_masks = np.asarray(known_masks, dtype=np.uint16)
+    return known_masks & ~pass_masks & np.uint16(filter_mask)
+
+
+def failing_indices(pass_masks, known_masks, user_filters, flag_keys=FLAG_KEYS):
+    """
+    Evaluate a whole label at once
+
+    Returns: Dict of {filter_name: array of indices of the ingredients failing it}
+    """
+    bits = flag_bits(flag_keys)
+    fails = failing_bits(pass_masks, known_masks, compile_filters(user_filters, flag_keys))
+    return {
+        filter_name: np.flatnonzero(fails & bits.get(filter_name, 0))
+        for filter_name in user_filters
+    }
+
+
+def filters_in_mask(mask, user_filters, flag_keys=FLAG_KEYS):
+    """Names from user_filters whose bit is set in mask"""
+    bits = flag_bits(flag_keys)
+    return [filter_name for filter_name in user_filters if mask & bits.get(filter_name, 0)]
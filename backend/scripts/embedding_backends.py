@@ -0,0 +1,217 @@
+"""
+Embedding model backends: PyTorch (sentence-transformers) or ONNX Runtime
+
+The ONNX backend runs the same MiniLM weights exported to ONNX on the CPU
+provider, with the SentenceTransformer pipeline (mean pooling over the
+attention mask, then L2 normalization) done in NumPy. In float32 it
+matches the torch backend to rounding error, so stored embeddings stay
+valid. "onnx-int8" uses dynamically quantized weights: faster and
+smaller, but its vectors drift slightly, so it has its own model key and
+switching to or from it re-encodes the stored embeddings.
+
+Export once per deploy (from backend/; needs torch, which sentence-transformers
+already pulls in, and onnx for --quantize):
+    python -m scripts.embedding_backends export [--quantize]
+Otherwise the model is exported on first load. Stored embeddings are
+re-encoded by the app's warm-up after a backend switch, or by hand with:
+    python -m scripts.embedding_backends reindex
+"""
+import argparse
+import os
+import threading
+import numpy as np
+
+# Backend name -> suffix of the model key (None = same vectors as torch)
+EMBEDDING_BACKENDS = {
+    "torch": None,
+    "onnx": None,
+    "onnx-int8": "onnx-int8",
+}
+
+
+def embedding_model_key(model_name, backend):
+    """
+    Identifies which vectors a backend produces
+
+    Backends sharing a key produce interchangeable embeddings; caches,
+    snapshots and the stored column are tagged with it.
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend} (expected one of {', '.join(EMBEDDING_BACKENDS)})")
+    suffix = EMBEDDING_BACKENDS[backend]
+    return f"{model_name}+{suffix}" if suffix else model_name
+
+
+class TorchEmbedder:
+    """SentenceTransformer on PyTorch"""
+
+    backend = "torch"
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts, batch_size=32):
+        embeddings = self.model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True)
+        return embeddings.astype(np.float32)
+
+
+def export_onnx(model_name, export_dir, quantize=False):
+    """
+    Export a SentenceTransformer's transformer to ONNX (plus its tokenizer)
+
+    Writes model.onnx, tokenizer.json and max_seq_length.txt to export_dir,
+    and model_int8.onnx (dynamic int8 quantization of the weights) if
+    quantize is set. Steps whose output already exists are skipped.
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    fp32_path = os.path.join(export_dir, "model.onnx")
+    if not os.path.exists(fp32_path):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        st_model = SentenceTransformer(model_name, device="cpu")
+        transformer = st_model[0]
+        tokenizer = transformer.tokenizer
+        inputs = tokenizer(["warm-up"], return_tensors="pt")
+        input_names = ["input_ids", "attention_mask", "token_type_ids"]
+        tmp_path = f"{fp32_path}.tmp-{os.getpid()}"
+        with torch.no_grad():
+            torch.onnx.export(
+                transformer.auto_model,
+                tuple(inputs[name] for name in input_names),
+                tmp_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+                opset_version=14
+            )
+        tokenizer.backend_tokenizer.save(os.path.join(export_dir, "tokenizer.json"))
+        with open(os.path.join(export_dir, "max_seq_length.txt"), "w") as f:
+            f.write(str(st_model.max_seq_length))
+        os.rename(tmp_path, fp32_path)
+        print(f"Exported {model_name} to {fp32_path}")
+
+    if quantize:
+        int8_path = os.path.join(export_dir, "model_int8.onnx")
+        if not os.path.exists(int8_path):
+            try:
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+            except ImportError as e:
+                raise RuntimeError(
+                    f"Quantizing to {int8_path} needs the onnx package ({e}); "
+                    "run `python -m scripts.embedding_backends export --quantize` where onnx is installed"
+                ) from e
+            tmp_path = f"{int8_path}.tmp-{os.getpid()}"
+            quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+            os.rename(tmp_path, int8_path)
+            print(f"Quantized {fp32_path} to {int8_path}")
+        return int8_path
+    return fp32_path
+
+
+class OnnxEmbedder:
+    """
+    MiniLM exported to ONNX, on onnxruntime's CPU provider
+
+    The inference session (and its intra-op thread pool) is created on the
+    first encode in each process, not here: a session built in a preloading
+    gunicorn master would be inherited by forked workers without its pool
+    threads, and running it there can deadlock.
+    """
+
+    def __init__(self, model_name, export_dir, quantize=False, threads=0):
+        from tokenizers import Tokenizer
+
+        self.model_name = model_name
+        self.backend = "onnx-int8" if quantize else "onnx"
+        model_path = os.path.join(export_dir, "model_int8.onnx" if quantize else "model.onnx")
+        if not os.path.exists(model_path):
+            model_path = export_onnx(model_name, export_dir, quantize=quantize)
+        self.model_path = model_path
+        self.threads = threads
+
+        with open(os.path.join(export_dir, "max_seq_length.txt")) as f:
+            max_seq_length = int(f.read())
+        self.tokenizer = Tokenizer.from_file(os.path.join(export_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.enable_padding()
+        self._tokenizer_lock = threading.Lock()  # padding/truncation settings are shared state
+
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+        self._input_names = None
+
+    def _get_session(self):
+        """This process's inference session, created on first use"""
+        if self._session is None or self._session_pid != os.getpid():
+            with self._session_lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    import onnxruntime
+                    options = onnxruntime.SessionOptions()
+                    options.intra_op_num_threads = self.threads
+                    session = onnxruntime.InferenceSession(
+                        self.model_path, options, providers=["CPUExecutionProvider"]
+                    )
+                    self._input_names = {model_input.name for model_input in session.get_inputs()}
+                    self._session, self._session_pid = session, os.getpid()
+        return self._session
+
+    def encode(self, texts, batch_size=32):
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        session = self._get_session()
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            with self._tokenizer_lock:
+                encodings = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            inputs = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            token_embeddings = session.run(
+                None, {name: value for name, value in inputs.items() if name in self._input_names}
+            )[0]
+            # Mean pooling over real tokens, then L2 normalization (as the SentenceTransformer does)
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+        return np.vstack(batches)
+
+
+def create_embedder(backend, model_name, onnx_dir=None, threads=0):
+    """Load the embedding model for a backend"""
+    embedding_model_key(model_name, backend)  # validates the backend name
+    if backend == "torch":
+        return TorchEmbedder(model_name)
+    return OnnxEmbedder(model_name, onnx_dir, quantize=backend == "onnx-int8", threads=threads)
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+    from scripts import databasemethods
+
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX / re-encode stored embeddings")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write model.onnx (and model_int8.onnx)")
+    export_parser.add_argument("--dir", default=databasemethods.EMBEDDING_ONNX_DIR)
+    export_parser.add_argument("--quantize", action="store_true", help="Also write the int8 model")
+    commands.add_parser("reindex", help="Re-encode stored embeddings with EMBEDDING_BACKEND if they came from another")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(databasemethods.EMBEDDING_MODEL_NAME, args.dir, quantize=args.quantize)
+    else:
+        databasemethods.setup_database()
+        count = databasemethods.ensure_embeddings_current()
+        print(f"Embeddings are current ({databasemethods.EMBEDDING_MODEL_KEY}); re-encoded {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import os
+import re
+import sqlite3
+import threading
+import numpy as np
+
+from scripts.lru_cache import LRUCache
+
+
+def normalize_query(text):
+    """
+    Cache key for an ingredient string
+
+    Lowercased with whitespace collapsed. MiniLM's tokenizer is uncased and
+    splits on whitespace, so this never changes the embedding itself.
+    """
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of text embeddings in front of the embedding model
+
+    The memory tier is an LRU of up to `max_entries` vectors. With `path`
+    set, vectors are also kept in a SQLite file shared by every worker and
+    kept across restarts. Entries are keyed by model name as well, so
+    switching models never serves stale vectors.
+    """
+
+    def __init__(self, model_name, max_entries=20000, path=None):
+        self.model_name = model_name
+        self.path = path
+        self._memory = LRUCache(max_entries, name="embeddings")
+        self._db = None
+        self._db_pid = None
+        self._db_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.disk_hits = 0
+        self.encoded = 0
+
+    def _connection(self):
+        """SQLite connection for this process (call with _db_lock held)"""
+        if self._db is None or self._db_pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute('''
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (model, text)
+                )
+            ''')
+            self._db.commit()
+            self._db_pid = os.getpid()
+        return self._db
+
+    def _disk_get(self, keys):
+        found = {}
+        try:
+            with self._db_lock:
+                db = self._connection()
+                # Stay under SQLite's bound-parameter limit
+                for i in range(0, len(keys), 500):
+                    chunk = keys[i:i + 500]
+                    rows = db.execute(
+                        f"SELECT text, vector FROM embeddings WHERE model = ? "
+                        f"AND text IN ({','.join('?' * len(chunk))})",
+                        [self.model_name, *chunk]
+                    ).fetchall()
+                    for text, blob in rows:
+                        found[text] = np.frombuffer(blob, dtype=np.float32)
+        except sqlite3.Error as e:
+            print(f"Embedding cache read failed ({self.path}): {e}")
+        return found
+
+    def _disk_put(self, vectors):
+        try:
+            with self._db_lock:
+                db = self._connection()
+                db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text, vector) VALUES (?, ?, ?)",
+                    [(self.model_name, text, vector.tobytes()) for text, vector in vectors.items()]
+                )
+                db.commit()
+        except sqlite3.Error as e:
+            print(f"Embedding cache write failed ({self.path}): {e}")
+
+    def encode(self, texts, encode_fn):
+        """
+        Embeddings for texts, running the model only for uncached ones
+
+        Args:
+            texts: List of strings
+            encode_fn: Called with the list of uncached (normalized) strings;
+                       returns their embeddings as a 2D array
+
+        Returns: float32 array with one row per input text, in input order
+        """
+        keys = [normalize_query(text) for text in texts]
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        unique_keys = list(dict.fromkeys(keys))
+
+        found = self._memory.get_many(unique_keys)
+        missing = [key for key in unique_keys if key not in found]
+
+        if missing and self.path:
+            from_disk = self._disk_get(missing)
+            if from_disk:
+                self._memory.put_many(from_disk)
+                found.update(from_disk)
+                missing = [key for key in missing if key not in from_disk]
+                with self._stats_lock:
+                    self.disk_hits += len(from_disk)
+
+        if missing:
+            vectors = np.asarray(encode_fn(missing), dtype=np.float32)
+            computed = {}
+            for key, vector in zip(missing, vectors):
+                vector.setflags(write=False)
+                computed[key] = vector
+            self._memory.put_many(computed)
+            if self.path:
+                self._disk_put(computed)
+            found.update(computed)
+            with self._stats_lock:
+                self.encoded += len(computed)
+
+        return np.vstack([found[key] for key in keys])
+
+    def clear(self):
+        """Drop the memory tier (the disk tier is only ever added to)"""
+        self._memory.clear()
+
+    def stats(self):
+        memory = self._memory.stats()
+        with self._stats_lock:
+            return {
+                "memory": memory,
+                "disk_path": self.path,
+                "disk_hits": self.disk_hits,
+                "encoded": self.encoded
+            }
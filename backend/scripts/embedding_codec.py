@@ -0,0 +1,83 @@
+import numpy as np
+
+# Storage types for embeddings, largest first
+EMBEDDING_DTYPES = ("float32", "float16", "int8")
+
+# Prefix of quantized blobs: a float32 NaN, which a real float32 embedding
+# never starts with, so blobs without it are the original raw float32 layout
+QUANTIZED_MAGIC = b"\x00\x00\xc0\xff"
+_DTYPE_CODES = {"float16": 1, "int8": 2}
+_CODE_DTYPES = {code: dtype for dtype, code in _DTYPE_CODES.items()}
+
+
+def check_dtype(dtype):
+    if dtype not in EMBEDDING_DTYPES:
+        raise ValueError(f"Unknown embedding dtype: {dtype} (expected one of {', '.join(EMBEDDING_DTYPES)})")
+    return dtype
+
+
+def quantize(vectors, dtype):
+    """
+    Convert float32 vectors (one per row) to the storage dtype
+
+    Returns: (values, scales). For int8 each row is scaled so its largest
+             component maps to 127 and `scales` holds the per-row factor
+             back to float; for the float types scales is None.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float32":
+        return vectors, None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    check_dtype(dtype)
+    peaks = np.abs(vectors).max(axis=-1)
+    scales = np.where(peaks > 0, peaks / 127.0, 1.0).astype(np.float32)
+    values = np.rint(vectors / scales[..., None]).astype(np.int8)
+    return values, scales
+
+
+def dequantize(values, scales=None):
+    """float32 copy of vectors stored with quantize()"""
+    vectors = np.asarray(values, dtype=np.float32)
+    if scales is not None:
+        vectors = vectors * np.asarray(scales, dtype=np.float32)[..., None]
+    return vectors
+
+
+def encode_embedding(vector, dtype="float32"):
+    """
+    Bytes for one embedding in the given storage dtype
+
+    float32 is written as raw bytes (the original layout). Quantized types
+    are QUANTIZED_MAGIC, a dtype code byte, then for int8 the float32 scale,
+    then the values.
+    """
+    values, scale = quantize(np.asarray(vector, dtype=np.float32).ravel(), dtype)
+    if dtype == "float32":
+        return values.tobytes()
+    header = QUANTIZED_MAGIC + bytes([_DTYPE_CODES[dtype]])
+    if scale is not None:
+        header += np.float32(scale).tobytes()
+    return header + values.tobytes()
+
+
+def embedding_dtype(blob):
+    """Storage dtype of an encoded embedding"""
+    blob = bytes(blob[:len(QUANTIZED_MAGIC) + 1])
+    if blob.startswith(QUANTIZED_MAGIC):
+        return _CODE_DTYPES[blob[len(QUANTIZED_MAGIC)]]
+    return "float32"
+
+
+def decode_embedding(blob):
+    """float32 vector from bytes written by encode_embedding (any dtype)"""
+    if isinstance(blob, memoryview):
+        blob = blob.tobytes()
+    dtype = embedding_dtype(blob)
+    if dtype == "float32":
+        return np.frombuffer(blob, dtype=np.float32)
+    offset = len(QUANTIZED_MAGIC) + 1
+    if dtype == "float16":
+        return np.frombuffer(blob, dtype=np.float16, offset=offset).astype(np.float32)
+    scale = np.frombuffer(blob, dtype=np.float32, count=1, offset=offset)[0]
+    return np.frombuffer(blob, dtype=np.int8, offset=offset + 4).astype(np.float32) * scale
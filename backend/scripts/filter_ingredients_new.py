@@ -1,9 +1,97 @@
 import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from scripts.single_flight import SingleFlight
+from scripts.llm_scheduler import BatchScheduler
+from scripts.dietary_flags import (
+    compile_filters,
+    encode_flags,
+    failing_bits,
+    failing_indices,
+    filters_in_mask
+)
 from scripts.databasemethods import (
-    get_or_infer_properties, 
-    add_ingredient
+    resolve_ingredients,
+    add_ingredient,
+    FILTER_TO_COLUMN
 )
 
+# Max concurrent Gemini calls for unknown ingredients (shared by every analysis job)
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+# Max unknown ingredients sent to the LLM in one prompt (1 = one call per ingredient)
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "10"))
+# How long the scheduler collects unknown ingredients from all jobs before one batch call
+LLM_BATCH_WINDOW_MS = int(os.getenv("LLM_BATCH_WINDOW_MS", "50"))
+
+_llm_executor = None
+_llm_executor_lock = threading.Lock()
+
+# Coalesces LLM lookups for the same ingredient across concurrent jobs
+_llm_flight = SingleFlight()
+
+# Merges unknown ingredients from concurrent jobs into shared batch calls (see start_llm_scheduler)
+_llm_scheduler = None
+
+def get_llm_executor():
+    """Lazy create the bounded thread pool used for LLM fallbacks"""
+    global _llm_executor
+    if _llm_executor is None:
+        with _llm_executor_lock:
+            if _llm_executor is None:
+                _llm_executor = ThreadPoolExecutor(
+                    max_workers=LLM_MAX_IN_FLIGHT,
+                    thread_name_prefix="llm-fallback"
+                )
+    return _llm_executor
+
+def get_llm_flight_stats():
+    """Hit / miss / coalesced counters for LLM ingredient lookups"""
+    return _llm_flight.stats()
+
+def start_llm_scheduler(model, window_ms=None, max_batch=None):
+    """
+    Start the cross-job micro-batching scheduler
+    
+    While it runs, unknown ingredients from every job are pooled for
+    window_ms (LLM_BATCH_WINDOW_MS) or until max_batch (LLM_BATCH_SIZE) are
+    waiting, then sent as one batch prompt. Without it each job batches
+    only its own unknowns.
+    """
+    global _llm_scheduler
+    window_ms = LLM_BATCH_WINDOW_MS if window_ms is None else window_ms
+    max_batch = max_batch or LLM_BATCH_SIZE
+    if window_ms <= 0 or max_batch <= 1:
+        return None
+    stop_llm_scheduler()
+    _llm_scheduler = BatchScheduler(
+        learn_ingredient_batch,
+        model,
+        get_llm_executor(),
+        window=window_ms / 1000,
+        max_batch=max_batch
+    )
+    _llm_scheduler.start()
+    return _llm_scheduler
+
+def stop_llm_scheduler():
+    """Stop the scheduler (already-queued ingredients are still sent)"""
+    global _llm_scheduler
+    if _llm_scheduler is not None:
+        _llm_scheduler.stop()
+        _llm_scheduler = None
+
+def get_llm_scheduler_stats():
+    """Batch counts and sizes for the micro-batching scheduler"""
+    if _llm_scheduler is None:
+        return {"running": False}
+    return _llm_scheduler.stats()
+
+def normalize_ingredient_name(ingredient):
+    """Key used to recognise the same ingredient across jobs"""
+    return " ".join(ingredient.lower().split())
+
 def analyze_ingredient_with_llm(ingredient, model):
     """
     Use LLM to determine dietary properties for unknown ingredient
@@ -61,7 +149,134 @@ No explanations, just the JSON object."""
             "low-sugar": 0
         }
 
-def filter_ingredients(ingredients, model, user_filters, similarity_threshold=0.85):
+def learn_ingredient(ingredient, model):
+    """Ask the LLM about one ingredient and store the answer for future scans"""
+    dietary_flags = analyze_ingredient_with_llm(ingredient, model)
+    add_ingredient(ingredient, dietary_flags, confidence=0.9)
+    return dietary_flags
+
+def is_valid_flags(dietary_flags):
+    """True if an LLM answer has a 0/1 verdict for every filter"""
+    if not isinstance(dietary_flags, dict):
+        return False
+    return all(dietary_flags.get(filter_name) in (0, 1) for filter_name in FILTER_TO_COLUMN)
+
+def learn_ingredient_batch(ingredients, model):
+    """
+    Ask the LLM about several ingredients in one prompt and store the answers
+    
+    Ingredients missing from the batch reply, or with a malformed entry,
+    are retried one at a time.
+    
+    Returns: Dict of {ingredient: dietary_flags}
+    """
+    try:
+        batch = batch_analyze_ingredients(ingredients, model)
+    except Exception as e:
+        print(f"Batch analysis failed: {e}")
+        batch = {}
+    if not isinstance(batch, dict):
+        batch = {}
+    batch = {str(name).lower().strip(): flags for name, flags in batch.items()}
+    
+    learned = {}
+    for ingredient in ingredients:
+        dietary_flags = batch.get(ingredient)
+        if is_valid_flags(dietary_flags):
+            add_ingredient(ingredient, dietary_flags, confidence=0.9)
+            learned[ingredient] = dietary_flags
+        else:
+            print(f"  → '{ingredient}' missing from batch reply, retrying alone")
+            learned[ingredient] = learn_ingredient(ingredient, model)
+    return learned
+
+def _learn_single(ingredients, model):
+    return {ingredients[0]: learn_ingredient(ingredients[0], model)}
+
+def _learn_and_publish(learn, ingredients, model):
+    """Run an LLM lookup for owned ingredients and hand the answers to any waiters"""
+    try:
+        learned = learn(ingredients, model)
+    except Exception as e:
+        for ingredient in ingredients:
+            _llm_flight.fail(ingredient, e)
+        raise
+    for ingredient in ingredients:
+        _llm_flight.resolve(ingredient, learned[ingredient])
+    return learned
+
+def _learn_through_scheduler(scheduler, owned):
+    """Queue owned ingredients on the shared scheduler and publish answers as they land"""
+    futures = {}
+    for i, key in enumerate(owned):
+        try:
+            futures[key] = scheduler.submit(key)
+        except Exception as e:
+            for unsubmitted in owned[i:]:
+                _llm_flight.fail(unsubmitted, e)
+            raise
+    
+    def publish(key, future):
+        if future.exception() is not None:
+            _llm_flight.fail(key, future.exception())
+        else:
+            _llm_flight.resolve(key, future.result())
+    
+    for key, future in futures.items():
+        future.add_done_callback(lambda done, key=key: publish(key, done))
+    return {key: future.result() for key, future in futures.items()}
+
+def analyze_unknown_ingredients(ingredients, model, batch_size=None):
+    """
+    Resolve unknown ingredients through the LLM
+    
+    Ingredients are split into chunks of up to batch_size (LLM_BATCH_SIZE by
+    default), one prompt per chunk, and chunks run concurrently. At most
+    LLM_MAX_IN_FLIGHT calls run at once across all jobs. An ingredient that
+    another job is already asking about is not asked again; this job waits
+    for that answer instead.
+    
+    Returns: Dict of {ingredient: dietary_flags}
+    """
+    batch_size = batch_size or LLM_BATCH_SIZE
+    keys = {ingredient: normalize_ingredient_name(ingredient) for ingredient in ingredients}
+    owned, shared = _llm_flight.claim(keys.values())
+    
+    scheduler = _llm_scheduler
+    if scheduler is not None and scheduler.running and batch_size > 1:
+        learned = _learn_through_scheduler(scheduler, owned)
+        for key, future in shared.items():
+            learned[key] = future.result()
+        return {ingredient: learned[key] for ingredient, key in keys.items()}
+    
+    executor = get_llm_executor()
+    
+    if batch_size <= 1:
+        chunks = [[key] for key in owned]
+        learn = _learn_single
+    else:
+        chunks = [owned[i:i + batch_size] for i in range(0, len(owned), batch_size)]
+        learn = learn_ingredient_batch
+    
+    futures = []
+    for i, chunk in enumerate(chunks):
+        try:
+            futures.append(executor.submit(_learn_and_publish, learn, chunk, model))
+        except Exception as e:
+            for unsubmitted in chunks[i:]:
+                for key in unsubmitted:
+                    _llm_flight.fail(key, e)
+            raise
+    
+    learned = {}
+    for future in futures:
+        learned.update(future.result())
+    for key, future in shared.items():
+        learned[key] = future.result()
+    return {ingredient: learned[key] for ingredient, key in keys.items()}
+
+def filter_ingredients(ingredients, model, user_filters, similarity_threshold=0.85, on_progress=None,
+                       early_exit=False, full_failing=False):
     """
     Analyze ingredients against user's dietary filters using embeddings
     
@@ -70,19 +285,35 @@ def filter_ingredients(ingredients, model, user_filters, similarity_threshold=0.
         model: Gemini model for LLM fallback
         user_filters: List of filter names (e.g., ["vegan", "halal"])
         similarity_threshold: Minimum similarity for inference (0.80-0.95)
+        on_progress: Optional callback receiving lists of progress events as
+            ingredients are resolved:
+            - {"type": "ingredient", "ingredient", "source", "fails", "done", "total"}
+            - {"type": "filter", "filter", "result": "fail", "ingredient"} when a
+              filter first fails, and {"type": "filter", "filter", "result": "pass"}
+              at the end for every filter that held
+            - {"type": "decided", "results"} once every filter has failed (early_exit only)
+            - {"type": "skipped", "ingredients"} listing ingredients left unresolved
+        early_exit: Stop before the LLM tier once every filter has already
+            failed on ingredients the database (or a recent LLM answer) knows
+        full_failing: With early_exit, still resolve everything so the failing
+            lists are complete; the verdict is only reported early via "decided"
     
     Returns:
         results: Dict of {filter_name: "pass" or "fail"}
         failing_ingredients: Dict of {filter_name: [list of ingredients]}
-        stats: Dict with performance metrics
+            (only those resolved before an early exit)
     """
     results = {}
-    failing_ingredients = {}
     
     # Initialize results
     for filter_name in user_filters:
         results[filter_name] = "pass"
-        failing_ingredients[filter_name] = []
+    
+    # Filters compile to one bitmask; each ingredient is a (pass, known) mask
+    # pair, and unresolved ingredients stay all-unknown so they never fail
+    filter_mask = compile_filters(user_filters)
+    pass_masks = np.zeros(len(ingredients), dtype=np.uint16)
+    known_masks = np.zeros(len(ingredients), dtype=np.uint16)
     
     # Statistics
     # stats = {
@@ -95,47 +326,107 @@ def filter_ingredients(ingredients, model, user_filters, similarity_threshold=0.
     print(f"\nAnalyzing {len(ingredients)} ingredients...")
     print("-" * 60)
     
-    # Process each ingredient
-    for ingredient in ingredients:
-        ingredient_lower = ingredient.lower().strip()
-        
-        # Get properties (exact match or similarity inference)
-        properties, source = get_or_infer_properties(
-            ingredient_lower, 
-            similarity_threshold=similarity_threshold
-        )
+    done = 0
+    
+    def check(positions, masks, sources):
+        """Record masks for resolved ingredients and report what they fail"""
+        nonlocal done
+        if not positions:
+            return
+        pass_masks[positions] = [pass_mask for pass_mask, _ in masks]
+        known_masks[positions] = [known_mask for _, known_mask in masks]
+        fail_bits = failing_bits(pass_masks[positions], known_masks[positions], filter_mask)
         
-        # Track statistics
-        if source == "exact":
+        events = []
+        for i, bits, source in zip(positions, fail_bits, sources):
+            ingredient = ingredients[i]
+            fails = filters_in_mask(int(bits), user_filters)
+            done += 1
+            events.append({
+                "type": "ingredient",
+                "ingredient": ingredient,
+                "source": source,
+                "fails": fails,
+                "done": done,
+                "total": len(ingredients)
+            })
+            for filter_name in fails:
+                if results[filter_name] == "pass":
+                    results[filter_name] = "fail"
+                    events.append({
+                        "type": "filter",
+                        "filter": filter_name,
+                        "result": "fail",
+                        "ingredient": ingredient
+                    })
+        if on_progress and events:
+            on_progress(events)
+    
+    # Get properties for the whole label at once (exact match or similarity inference)
+    resolved = resolve_ingredients(
+        [ingredient.lower().strip() for ingredient in ingredients],
+        similarity_threshold=similarity_threshold,
+        decode=False
+    )
+    
+    # Report everything the database already knows before waiting on the LLM
+    known = [i for i, (_, source) in enumerate(resolved) if source != "unknown"]
+    for i in known:
+        if resolved[i][1] == "exact":
             # stats["exact_matches"] += 1
-            print(f"✓ {ingredient:<30} [exact match]")
-        # elif source.startswith("similar:"):
-            # stats["inferred_from_similarity"] += 1
-            # Already printed in get_or_infer_properties
-        elif source == "unknown":
-            # Fallback to LLM
-            print(f"⚠ {ingredient:<30} [calling LLM...]")
+            print(f"✓ {ingredients[i]:<30} [exact match]")
+    check(known, [resolved[i][0] for i in known], [resolved[i][1] for i in known])
+    
+    # Ingredients another job just asked the LLM about are known too
+    unknown = [i for i, (_, source) in enumerate(resolved) if source == "unknown"]
+    cached = _llm_flight.peek(normalize_ingredient_name(ingredients[i]) for i in unknown)
+    if cached:
+        recent = [i for i in unknown if normalize_ingredient_name(ingredients[i]) in cached]
+        unknown = [i for i in unknown if normalize_ingredient_name(ingredients[i]) not in cached]
+        check(
+            recent,
+            [encode_flags(cached[normalize_ingredient_name(ingredients[i])]) for i in recent],
+            ["cached"] * len(recent)
+        )
+    
+    # Every filter already failed: the LLM tier cannot change the verdict
+    decided = bool(user_filters) and all(result == "fail" for result in results.values())
+    if early_exit and decided and unknown:
+        if on_progress:
+            on_progress([{"type": "decided", "results": dict(results)}])
+        if not full_failing:
+            print(f"⏭ All filters failed, skipping {len(unknown)} LLM lookup(s)")
+            if on_progress:
+                on_progress([{"type": "skipped", "ingredients": [ingredients[i] for i in unknown]}])
+            unknown = []
+    
+    # Send every unknown ingredient to the LLM at once rather than one by one
+    if unknown:
+        print(f"⚠ {len(unknown)} unknown ingredient(s) [calling LLM...]")
+        llm_results = analyze_unknown_ingredients(
+            [ingredients[i].lower().strip() for i in unknown], model
+        )
+        for i in unknown:
             # stats["llm_calls"] += 1
-            
-            dietary_flags = analyze_ingredient_with_llm(ingredient_lower, model)
-            
-            # Store in database for future use
-            add_ingredient(ingredient_lower, dietary_flags, confidence=0.9)
-            properties = dietary_flags
-            print(f"  → Added to database")
-        
-        # Check against user's filters
-        if properties:
-            for filter_name in user_filters:
-                # Properties use same keys as user_filters
-                # 0 = fails filter, 1 = passes filter, None = unknown
-                passes = properties.get(filter_name)
-
-                print(passes)
-                
-                if passes == 0:  # Ingredient fails this filter
-                    results[filter_name] = "fail"
-                    failing_ingredients[filter_name].append(ingredient)
+            print(f"⚠ {ingredients[i]:<30} [LLM, added to database]")
+        check(
+            unknown,
+            [encode_flags(llm_results[ingredients[i].lower().strip()]) for i in unknown],
+            ["llm"] * len(unknown)
+        )
+    
+    passed = [
+        {"type": "filter", "filter": filter_name, "result": "pass"}
+        for filter_name in user_filters if results[filter_name] == "pass"
+    ]
+    if on_progress and passed:
+        on_progress(passed)
+    
+    # Failing ingredients in label order, regardless of which tier resolved them
+    failing_ingredients = {
+        filter_name: [ingredients[i] for i in positions]
+        for filter_name, positions in failing_indices(pass_masks, known_masks, user_filters).items()
+    }
     
     # print("-" * 60)
     # print(f"Stats: {stats['exact_matches']} exact | " +
@@ -152,13 +443,14 @@ def batch_analyze_ingredients(ingredients, model):
     
     Returns: Dict of {ingredient: dietary_flags}
     """
-    ingredients_str = ", ".join(ingredients)
+    ingredients_str = json.dumps(list(ingredients))
     
     prompt = f"""Analyze these ingredients for dietary restrictions: {ingredients_str}
 
 For EACH ingredient, determine if it passes (1) or fails (0) these restrictions:
 - vegan, vegetarian, halal, gluten-free, lactose-intolerant, nut-allergy, anti-inflammatory, low-sugar
 
+Use each ingredient string exactly as given as its key.
 Respond ONLY with valid JSON in this format:
 {{
   "butter": {{"vegan": 0, "vegetarian": 1, "halal": 1, "gluten-free": 1, "lactose-intolerant": 0, "nut-allergy": 1, "anti-inflammatory": 0, "low-sugar": 1}},
@@ -0,0 +1,254 @@
+"""
+Export/import the ingredients table, embeddings included
+
+A snapshot is a directory:
+    ingredients.ndjson  one {"name", "flags", "has_embedding"} object per line
+    embeddings.npy      float32 matrix, row i belongs to line i (zeros if none);
+                        stored float16/int8 blobs are expanded to float32
+    meta.json           row count, embedding model key, stored dtype and dimension
+
+Usage (from backend/):
+    python -m scripts.ingredient_snapshot export snapshots/latest
+    python -m scripts.ingredient_snapshot import snapshots/latest [--replace]
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from dotenv import load_dotenv
+
+# databasemethods reads its configuration (model key, storage dtype, ...) at import
+load_dotenv()
+
+from scripts import databasemethods
+from scripts.db_pool import get_connection
+from scripts.embedding_codec import decode_embedding, embedding_dtype, encode_embedding
+from scripts.databasemethods import (
+    EMBEDDING_MODEL_KEY,
+    EMBEDDING_STORAGE_DTYPE,
+    EMBEDDING_MODEL_NAME,
+    FILTER_TO_COLUMN,
+    setup_database,
+    invalidate_lookup_caches,
+    reload_similarity_index
+)
+
+SNAPSHOT_FORMAT = 1
+FLAG_COLUMNS = list(FILTER_TO_COLUMN.values())
+
+
+def export_ingredients(path, fetch_size=2000):
+    """
+    Stream the ingredients table into a snapshot directory
+
+    Rows are read through a server-side cursor in one repeatable-read
+    transaction, so the snapshot is consistent and memory use is flat.
+
+    Returns: Number of ingredients exported
+    """
+    start = time.perf_counter()
+    os.makedirs(path, exist_ok=True)
+
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        c.execute("SELECT count(*) FROM ingredients")
+        count = c.fetchone()[0]
+        # Blob length depends on the stored precision, so take the dimension from one vector
+        c.execute("SELECT embedding FROM ingredients WHERE embedding IS NOT NULL LIMIT 1")
+        sample = c.fetchone()
+        dim = len(decode_embedding(sample[0])) if sample else 0
+        dtype = embedding_dtype(sample[0]) if sample else EMBEDDING_STORAGE_DTYPE
+
+        embeddings = np.lib.format.open_memmap(
+            os.path.join(path, "embeddings.npy"), mode="w+", dtype=np.float32, shape=(count, dim)
+        )
+        rows = conn.cursor(name="ingredient_export")
+        rows.itersize = fetch_size
+        rows.execute(f"""
+            SELECT name, embedding, {', '.join(FLAG_COLUMNS)}
+            FROM ingredients
+            ORDER BY id
+        """)
+
+        written = 0
+        with open(os.path.join(path, "ingredients.ndjson"), "w") as f:
+            for name, embedding, *flags in rows:
+                has_embedding = embedding is not None
+                if has_embedding:
+                    embeddings[written] = decode_embedding(embedding)
+                f.write(json.dumps({
+                    "name": name,
+                    "flags": dict(zip(FILTER_TO_COLUMN, flags)),
+                    "has_embedding": has_embedding
+                }) + "\n")
+                written += 1
+        rows.close()
+        embeddings.flush()
+        del embeddings
+
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({
+            "format": SNAPSHOT_FORMAT,
+            "count": written,
+            "dim": dim,
+            "model": EMBEDDING_MODEL_KEY,
+            "dtype": dtype,
+            "exported_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        }, f, indent=2)
+
+    seconds = time.perf_counter() - start
+    print(f"Exported {written} ingredients to {path} in {seconds:.2f}s")
+    return written
+
+
+def _copy_rows(path, dtype):
+    """Yield CSV text for COPY, one chunk at a time (embeddings encoded as dtype)"""
+    embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    with open(os.path.join(path, "ingredients.ndjson")) as f:
+        for i, line in enumerate(f):
+            row = json.loads(line)
+            embedding = None
+            if row["has_embedding"]:
+                embedding = "\\x" + encode_embedding(embeddings[i], dtype).hex()
+            writer.writerow([
+                row["name"],
+                embedding,
+                *[row["flags"].get(filter_name) for filter_name in FILTER_TO_COLUMN]
+            ])
+            if buffer.tell() > 1 << 20:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _check_merge_target(c, meta):
+    """
+    Refuse to merge a snapshot into a table whose embeddings don't match it
+
+    The existing rows' model key (from embedding_meta; untagged tables hold
+    torch embeddings) and stored dtype must be the snapshot's, or the merged
+    table would mix vectors that don't compare, or silently lose precision.
+
+    Returns: True if the table holds no embeddings yet (nothing to match)
+    """
+    c.execute("SELECT value FROM embedding_meta WHERE key = 'model'")
+    row = c.fetchone()
+    target_model = row[0] if row else EMBEDDING_MODEL_NAME
+    c.execute("SELECT embedding FROM ingredients WHERE embedding IS NOT NULL LIMIT 1")
+    row = c.fetchone()
+    if row is None:
+        return True
+    if meta["model"] != target_model:
+        raise ValueError(
+            f"Snapshot embeddings come from {meta['model']}, the table's from {target_model}; "
+            f"use --replace to load it anyway"
+        )
+    target_dtype = embedding_dtype(row[0])
+    if "dtype" not in meta:
+        print(f"Snapshot predates dtype tracking; assuming it matches the table ({target_dtype})")
+    elif meta["dtype"] != target_dtype:
+        raise ValueError(
+            f"Snapshot embeddings are {meta['dtype']}, the table's are {target_dtype}; "
+            f"use --replace to load it anyway"
+        )
+    return False
+
+
+def import_ingredients(path, replace=False):
+    """
+    Load a snapshot with COPY in one transaction
+
+    Rows are copied into a temporary table and upserted by name, so an
+    import can be re-run safely. With replace=True the table is emptied
+    first (in the same transaction); otherwise the table's embeddings must
+    come from the same model key and dtype as the snapshot's. Embeddings
+    are stored back in the snapshot's dtype (EMBEDDING_STORAGE_DTYPE for
+    snapshots that don't record it).
+
+    Returns: Number of ingredients imported
+    """
+    start = time.perf_counter()
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    if meta.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format: {meta.get('format')}")
+    if meta["count"] and meta["model"] != EMBEDDING_MODEL_KEY:
+        raise ValueError(
+            f"Snapshot embeddings come from {meta['model']}, this build uses {EMBEDDING_MODEL_KEY}"
+        )
+
+    setup_database()
+    columns = ["name", "embedding", *FLAG_COLUMNS]
+    with tempfile.TemporaryFile("w+") as spool:
+        for chunk in _copy_rows(path, meta.get("dtype", EMBEDDING_STORAGE_DTYPE)):
+            spool.write(chunk)
+        spool.seek(0)
+
+        with get_connection() as conn:
+            c = conn.cursor()
+            c.execute(f"""
+                CREATE TEMP TABLE ingredients_import (
+                    name TEXT NOT NULL,
+                    embedding BYTEA,
+                    {', '.join(f'{column} INTEGER' for column in FLAG_COLUMNS)}
+                ) ON COMMIT DROP
+            """)
+            c.copy_expert(
+                f"COPY ingredients_import ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                spool
+            )
+            if replace:
+                c.execute("DELETE FROM ingredients")
+            if replace or _check_merge_target(c, meta):
+                c.execute('''
+                    INSERT INTO embedding_meta (key, value) VALUES ('model', %s)
+                    ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+                ''', (EMBEDDING_MODEL_KEY,))
+            c.execute(f"""
+                INSERT INTO ingredients ({', '.join(columns)})
+                SELECT DISTINCT ON (name) {', '.join(columns)} FROM ingredients_import
+                ON CONFLICT (name) DO UPDATE SET
+                    {', '.join(f'{column} = EXCLUDED.{column}' for column in columns[1:])}
+            """)
+            imported = c.rowcount
+
+    # Table changed underneath this process: rebuild what was derived from it
+    invalidate_lookup_caches()
+    if databasemethods._similarity_index is not None:
+        reload_similarity_index()
+
+    seconds = time.perf_counter() - start
+    rate = imported / seconds if seconds > 0 else float("inf")
+    print(f"Imported {imported} ingredients from {path} in {seconds:.2f}s ({rate:.0f} rows/s)")
+    return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export/import the ingredients table")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Write a snapshot directory")
+    export_parser.add_argument("path")
+
+    import_parser = commands.add_parser("import", help="Load a snapshot directory")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--replace", action="store_true",
+                               help="Delete existing ingredients first")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_ingredients(args.path)
+    else:
+        import_ingredients(args.path, replace=args.replace)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import queue
+import threading
+import time
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when the queue is at max depth"""
+
+
+class JobQueue:
+    """
+    Fixed pool of worker threads fed by a bounded FIFO queue
+
+    submit() never blocks: once `max_depth` jobs are waiting it raises
+    QueueFull so the caller can shed load. Tracks how long jobs wait
+    before a worker picks them up.
+    """
+
+    def __init__(self, workers=4, max_depth=32, name="analysis"):
+        self.workers = workers
+        self.max_depth = max_depth
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_depth)
+        self._threads = []
+        self._accepting = False
+        self._lock = threading.Lock()
+        self._active = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def start(self):
+        if self._accepting:
+            return
+        self._accepting = True
+        self._threads = [
+            threading.Thread(target=self._run, name=f"{self.name}-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) for a worker; raises QueueFull if at capacity"""
+        if not self._accepting:
+            raise QueueFull(f"{self.name} queue is shutting down")
+        try:
+            self._queue.put_nowait((time.monotonic(), fn, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise QueueFull(f"{self.name} queue is full ({self.max_depth} jobs waiting)")
+        with self._lock:
+            self.submitted += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            enqueued_at, fn, args, kwargs = item
+            waited = time.monotonic() - enqueued_at
+            with self._lock:
+                self._active += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            try:
+                fn(*args, **kwargs)
+                succeeded = True
+            except Exception as e:
+                print(f"Job failed in {self.name} queue: {e}")
+                succeeded = False
+            with self._lock:
+                self._active -= 1
+                if succeeded:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            self._queue.task_done()
+
+    def shutdown(self, timeout=30.0):
+        """
+        Stop accepting jobs and let queued/running ones finish
+
+        Waits up to `timeout` seconds in total; workers are daemon threads,
+        so anything still running after that is abandoned at process exit.
+        """
+        if not self._accepting:
+            return
+        self._accepting = False
+        deadline = time.monotonic() + timeout
+        for _ in self._threads:
+            try:
+                # One stop marker per worker, queued behind the pending jobs
+                self._queue.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                return
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def stats(self):
+        with self._lock:
+            started = self.completed + self.failed + self._active
+            return {
+                "workers": self.workers,
+                "max_depth": self.max_depth,
+                "queued": self._queue.qsize(),
+                "active": self._active,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_ms": round(1000 * self._wait_total / started, 1) if started else 0.0,
+                "max_wait_ms": round(1000 * self._wait_max, 1)
+            }
@@ -0,0 +1,377 @@
+import threading
+import time
+from collections import OrderedDict
+
+from psycopg2.extras import Json, execute_values
+
+from scripts.db_pool import get_connection
+
+# Job statuses after which an entry only needs to live until the client fetches it
+FINISHED_STATUSES = ("complete", "error")
+
+
+class InMemoryJobStore:
+    """
+    Thread-safe store for analysis job state
+
+    Finished jobs (complete/error) expire `ttl` seconds after they finish.
+    The store holds at most `max_entries` jobs; when full, the least
+    recently used finished job is evicted first, and only if there is none
+    the least recently used job overall.
+
+    Each job also carries an append-only list of progress events; readers
+    can block in events() until something new arrives.
+    """
+
+    def __init__(self, ttl=600.0, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)  # notified on every update/event
+        self._jobs = OrderedDict()  # job_id -> job dict, least recently used first
+        self._expires_at = {}  # job_id -> monotonic deadline (finished jobs only)
+        self._events = {}  # job_id -> list of progress events
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def setup(self):
+        pass
+
+    def _purge_expired(self, now):
+        expired = [job_id for job_id, deadline in self._expires_at.items() if deadline <= now]
+        for job_id in expired:
+            del self._expires_at[job_id]
+            self._jobs.pop(job_id, None)
+            self._events.pop(job_id, None)
+        self.expired += len(expired)
+
+    def _evict_one(self):
+        victim = next(
+            (job_id for job_id, job in self._jobs.items() if job.get("status") in FINISHED_STATUSES),
+            next(iter(self._jobs))
+        )
+        del self._jobs[victim]
+        self._expires_at.pop(victim, None)
+        self._events.pop(victim, None)
+        self.evicted += 1
+
+    def create(self, job_id, job):
+        """Add (or replace) a job"""
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            self._jobs.pop(job_id, None)
+            self._events.pop(job_id, None)
+            while len(self._jobs) >= self.max_entries:
+                self._evict_one()
+            self._jobs[job_id] = dict(job)
+            self._track_expiry(job_id, now)
+            self._changed.notify_all()
+
+    def update(self, job_id, **fields):
+        """Merge fields into a job; returns False if the job no longer exists"""
+        now = time.monotonic()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            job.update(fields)
+            self._jobs.move_to_end(job_id)
+            self._track_expiry(job_id, now)
+            self._changed.notify_all()
+            return True
+
+    def append_events(self, job_id, events):
+        """Append progress events to a job; returns False if the job no longer exists"""
+        with self._lock:
+            if job_id not in self._jobs:
+                return False
+            self._events.setdefault(job_id, []).extend(events)
+            self._changed.notify_all()
+            return True
+
+    def events(self, job_id, cursor=0, timeout=0.0):
+        """
+        Read a job's progress events after `cursor`
+
+        If there are none yet and the job is unfinished, waits up to
+        `timeout` seconds for a new event, a status change or the job going
+        away. Updates to other jobs (which notify the same condition) don't
+        end the wait.
+
+        Returns: (job, events, cursor)
+            - job: Copy of the job, or None if unknown/expired
+            - events: List of new events
+            - cursor: Pass back in to continue after these events
+        """
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            job = self._jobs.get(job_id)
+            pending = job is not None and len(self._events.get(job_id, ())) <= cursor
+            if pending and timeout > 0 and job.get("status") not in FINISHED_STATUSES:
+                status = job.get("status")
+                self._changed.wait_for(
+                    lambda: self._jobs.get(job_id) is not job
+                    or len(self._events.get(job_id, ())) > cursor
+                    or job.get("status") != status,
+                    timeout
+                )
+                job = self._jobs.get(job_id)
+            if job is None:
+                return None, [], cursor
+            events = self._events.get(job_id, [])[cursor:]
+            return dict(job), events, cursor + len(events)
+
+    def _track_expiry(self, job_id, now):
+        if self._jobs[job_id].get("status") in FINISHED_STATUSES:
+            self._expires_at[job_id] = now + self.ttl
+        else:
+            self._expires_at.pop(job_id, None)
+
+    def get(self, job_id):
+        """Return a copy of the job, or None if unknown/expired"""
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            self._jobs.move_to_end(job_id)
+            return dict(job)
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._expires_at.pop(job_id, None)
+            self._events.pop(job_id, None)
+            self._changed.notify_all()
+
+    def stats(self):
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            return {
+                "backend": "memory",
+                "size": len(self._jobs),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "expired": self.expired,
+                "evicted": self.evicted
+            }
+
+
+class PostgresJobStore:
+    """
+    Job store in a Postgres table, so every gunicorn worker sees every job
+
+    Each job is one row keyed by job_id with its state in a JSONB column;
+    status reads are a primary-key lookup on a pooled connection. Finished
+    jobs expire `ttl` seconds after finishing and unfinished ones after
+    `stale_ttl` (e.g. their worker died). Expired rows are hidden from
+    reads immediately and deleted at most every `cleanup_interval` seconds.
+
+    Progress events live in a child table; events() polls it every
+    `event_poll_interval` seconds while waiting.
+    """
+
+    def __init__(self, ttl=600.0, stale_ttl=3600.0, cleanup_interval=60.0, event_poll_interval=0.25):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.cleanup_interval = cleanup_interval
+        self.event_poll_interval = event_poll_interval
+        self._last_cleanup = 0.0
+        self._cleanup_lock = threading.Lock()
+        self.expired = 0
+
+    def setup(self):
+        """Create the jobs table"""
+        with get_connection() as conn:
+            c = conn.cursor()
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS analysis_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    data JSONB NOT NULL,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    expires_at TIMESTAMPTZ NOT NULL
+                )
+            ''')
+            c.execute('''
+                CREATE INDEX IF NOT EXISTS idx_analysis_jobs_expires_at
+                ON analysis_jobs(expires_at)
+            ''')
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS analysis_job_events (
+                    event_id BIGSERIAL PRIMARY KEY,
+                    job_id TEXT NOT NULL REFERENCES analysis_jobs(job_id) ON DELETE CASCADE,
+                    event JSONB NOT NULL
+                )
+            ''')
+            c.execute('''
+                CREATE INDEX IF NOT EXISTS idx_analysis_job_events_job
+                ON analysis_job_events(job_id, event_id)
+            ''')
+
+    def _lifetime(self, status):
+        return self.ttl if status in FINISHED_STATUSES else self.stale_ttl
+
+    def _maybe_cleanup(self):
+        now = time.monotonic()
+        if now - self._last_cleanup < self.cleanup_interval:
+            return
+        if not self._cleanup_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_cleanup = now
+            with get_connection() as conn:
+                c = conn.cursor()
+                c.execute("DELETE FROM analysis_jobs WHERE expires_at <= now()")
+                self.expired += c.rowcount
+        finally:
+            self._cleanup_lock.release()
+
+    def create(self, job_id, job):
+        """Add (or replace) a job"""
+        self._maybe_cleanup()
+        status = job.get("status")
+        with get_connection() as conn:
+            c = conn.cursor()
+            c.execute('''
+                INSERT INTO analysis_jobs (job_id, status, data, expires_at)
+                VALUES (%s, %s, %s, now() + make_interval(secs => %s))
+                ON CONFLICT (job_id) DO UPDATE SET
+                    status = EXCLUDED.status,
+                    data = EXCLUDED.data,
+                    updated_at = now(),
+                    expires_at = EXCLUDED.expires_at
+            ''', (job_id, status, Json(job), self._lifetime(status)))
+            c.execute("DELETE FROM analysis_job_events WHERE job_id = %s", (job_id,))
+
+    def update(self, job_id, **fields):
+        """Merge fields into a job; returns False if the job no longer exists"""
+        with get_connection() as conn:
+            c = conn.cursor()
+            c.execute('''
+                UPDATE analysis_jobs SET
+                    status = COALESCE(%s, status),
+                    data = data || %s,
+                    updated_at = now(),
+                    expires_at = now() + make_interval(secs => CASE
+                        WHEN COALESCE(%s, status) = ANY(%s) THEN %s ELSE %s END)
+                WHERE job_id = %s AND expires_at > now()
+            ''', (
+                fields.get("status"),
+                Json(fields),
+                fields.get("status"),
+                list(FINISHED_STATUSES),
+                self.ttl,
+                self.stale_ttl,
+                job_id
+            ))
+            return c.rowcount > 0
+
+    def append_events(self, job_id, events):
+        """Append progress events to a job; returns False if the job no longer exists"""
+        if not events:
+            return True
+        with get_connection() as conn:
+            c = conn.cursor()
+            c.execute(
+                "SELECT 1 FROM analysis_jobs WHERE job_id = %s AND expires_at > now()",
+                (job_id,)
+            )
+            if c.fetchone() is None:
+                return False
+            execute_values(
+                c,
+                "INSERT INTO analysis_job_events (job_id, event) VALUES %s",
+                [(job_id, Json(event)) for event in events]
+            )
+            return True
+
+    def get(self, job_id):
+        """Return the job, or None if unknown/expired"""
+        with get_connection() as conn:
+            c = conn.cursor()
+            c.execute(
+                "SELECT data FROM analysis_jobs WHERE job_id = %s AND expires_at > now()",
+                (job_id,)
+            )
+            row = c.fetchone()
+        return row[0] if row else None
+
+    def _read_events(self, job_id, cursor):
+        with get_connection() as conn:
+            c = conn.cursor()
+            c.execute(
+                "SELECT data FROM analysis_jobs WHERE job_id = %s AND expires_at > now()",
+                (job_id,)
+            )
+            row = c.fetchone()
+            if row is None:
+                return None, [], cursor
+            c.execute('''
+                SELECT event_id, event FROM analysis_job_events
+                WHERE job_id = %s AND event_id > %s
+                ORDER BY event_id
+            ''', (job_id, cursor))
+            rows = c.fetchall()
+        return row[0], [event for _, event in rows], rows[-1][0] if rows else cursor
+
+    def events(self, job_id, cursor=0, timeout=0.0):
+        """
+        Read a job's progress events after `cursor`
+
+        If there are none yet and the job is unfinished, polls for up to
+        `timeout` seconds for an event or status change.
+
+        Returns: (job, events, cursor)
+            - job: The job, or None if unknown/expired
+            - events: List of new events
+            - cursor: Pass back in to continue after these events
+        """
+        deadline = time.monotonic() + timeout
+        job, events, next_cursor = self._read_events(job_id, cursor)
+        status = job and job.get("status")
+        while job is not None and not events and status not in FINISHED_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(self.event_poll_interval, remaining))
+            job, events, next_cursor = self._read_events(job_id, cursor)
+            if job is not None and job.get("status") != status:
+                break
+        return job, events, next_cursor
+
+    def delete(self, job_id):
+        with get_connection() as conn:
+            c = conn.cursor()
+            c.execute("DELETE FROM analysis_jobs WHERE job_id = %s", (job_id,))
+
+    def stats(self):
+        with get_connection() as conn:
+            c = conn.cursor()
+            c.execute("SELECT count(*) FROM analysis_jobs WHERE expires_at > now()")
+            size = c.fetchone()[0]
+        return {
+            "backend": "postgres",
+            "size": size,
+            "ttl_seconds": self.ttl,
+            "stale_ttl_seconds": self.stale_ttl,
+            "expired": self.expired
+        }
+
+
+# Available job store backends, selected with JOB_STORE_BACKEND
+JOB_STORE_BACKENDS = {
+    "memory": InMemoryJobStore,
+    "postgres": PostgresJobStore,
+}
+
+def create_job_store(backend="memory", **options):
+    """Create a job store of the requested backend"""
+    if backend not in JOB_STORE_BACKENDS:
+        raise ValueError(f"Unknown job store backend: {backend}")
+    return JOB_STORE_BACKENDS[backend](**options)
@@ -0,0 +1,235 @@
+import re
+import threading
+import zlib
+from array import array
+
+import numpy as np
+
+# Words that don't change what an ingredient is ("organic cane sugar" is cane sugar)
+QUALIFIERS = frozenset({
+    "organic", "certified", "non-gmo", "pure", "raw", "fresh", "unbleached", "unrefined"
+})
+
+# Words that flip what an ingredient is or which diets it suits ("non-dairy
+# creamer" is not "dairy creamer"); a match must agree on every one of them
+MODIFIERS = frozenset({
+    "non", "no", "free", "without", "vegan", "vegetarian", "meatless", "plant", "based",
+    "imitation", "artificial", "substitute", "alternative", "mock", "faux",
+    "low", "reduced", "lite", "light", "zero", "decaf", "decaffeinated", "halal", "kosher"
+})
+
+_WORD = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+
+def _singular(word):
+    """Crude plural stripping; only has to be consistent, since both sides go through it"""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("oes", "ches", "shes", "sses", "xes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def is_modifier(word):
+    """True for words a lexical match may never drop or change (see MODIFIERS)"""
+    return word in MODIFIERS or word.endswith(("free", "less")) or word.startswith("non")
+
+
+def _edit_distance(a, b):
+    """Edit distance counting a swap of adjacent letters as one edit"""
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (a[i - 1] != b[j - 1])
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def same_words(normalized, other):
+    """
+    Whether two normalized names name the same ingredient, word for word
+
+    Qualifiers and plurals are already gone from both, so the words must
+    pair up one to one; a pair may differ only by a spelling slip (one
+    edit, two in words of 8+ letters), and never in a modifier word.
+    "dairy creamer" vs "non dairy creamer" and "vegan worcestershire
+    sauce" vs "worcestershire sauce" are different ingredients.
+    """
+    words, other_words = normalized.split(), other.split()
+    if len(words) != len(other_words):
+        return False
+    unmatched = list(other_words)
+    leftover = []
+    for word in words:
+        if word in unmatched:
+            unmatched.remove(word)
+        else:
+            leftover.append(word)
+    for word in leftover:
+        if is_modifier(word):
+            return False
+        close = [
+            candidate for candidate in unmatched
+            if not is_modifier(candidate)
+            and _edit_distance(word, candidate) <= (2 if min(len(word), len(candidate)) >= 8 else 1)
+        ]
+        if not close:
+            return False
+        unmatched.remove(close[0])
+    return True
+
+
+def normalize_name(name):
+    """
+    Canonical form of an ingredient name for lexical matching
+
+    Lowercases, drops punctuation and qualifier words, and singularizes
+    each word: "Organic Tomatoes," and "tomato" both become "tomato".
+    """
+    words = _WORD.findall(name.lower())
+    kept = [word for word in words if word not in QUALIFIERS] or words
+    return " ".join(_singular(part) for word in kept for part in word.split("-"))
+
+
+class LexicalIndex:
+    """
+    Character-trigram index over ingredient names (no model involved)
+
+    Each name is normalized (see normalize_name) and reduced to the set of
+    its character trigrams, hashed into `buckets` ids; similarity is the
+    cosine of two such sets, |A & B| / sqrt(|A| * |B|). Lookups go through
+    an inverted index (trigram -> rows containing it), so a query only
+    touches names sharing a trigram with it and takes microseconds.
+
+    Catches the cheap variants - plurals, case and punctuation, "organic X",
+    one-letter OCR slips in longer words - but not synonyms; short names
+    score low on a single typo ("suger" vs "sugar" is 0.4), which is what
+    the embedding tier behind it is for.
+
+    A high trigram score alone is not a match: names must also agree word
+    for word (see same_words), so "dairy creamer" never resolves to
+    "non-dairy creamer" however similar they look.
+    """
+
+    def __init__(self, buckets=1 << 20):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._names = []
+        self._positions = {}  # name -> row
+        self._normalized = {}  # normalized name -> first row with it
+        self._sizes = array("i")  # trigrams per row
+        self._postings = {}  # trigram id -> array of rows containing it
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    def _features(self, normalized):
+        padded = f" {normalized} "
+        return {
+            zlib.crc32(padded[i:i + 3].encode()) % self.buckets
+            for i in range(len(padded) - 2)
+        }
+
+    def add_many(self, names):
+        """Index names not already present (a name's trigrams never change)"""
+        prepared = []
+        for name in names:
+            normalized = normalize_name(name)
+            prepared.append((name, normalized, self._features(normalized)))
+
+        with self._lock:
+            # Stage the batch before touching any state, so nothing can leave
+            # a row recorded but only partly indexed
+            rows = {}  # name -> (row, normalized)
+            sizes = array("i")
+            new_postings = {}  # trigram id -> new rows containing it
+            for name, normalized, features in prepared:
+                if name in self._positions or name in rows:
+                    continue
+                row = len(self._names) + len(rows)
+                rows[name] = (row, normalized)
+                sizes.append(len(features))
+                for feature in features:
+                    new_postings.setdefault(feature, array("i")).append(row)
+            if not rows:
+                return
+
+            for feature, new_rows in new_postings.items():
+                postings = self._postings.get(feature)
+                if postings is None:
+                    self._postings[feature] = new_rows
+                else:
+                    postings.extend(new_rows)
+            self._sizes.extend(sizes)
+            # Names first: search() reads _normalized without the lock
+            self._names.extend(rows)
+            for name, (row, normalized) in rows.items():
+                self._positions[name] = row
+                self._normalized.setdefault(normalized, row)
+
+    def add(self, name):
+        self.add_many([name])
+
+    def _count_overlap(self, features):
+        """
+        (rows, shared trigrams, row trigram counts) of rows sharing a trigram
+
+        Call with the lock held. The array views pin the postings' buffers,
+        and they are released when this returns, before the lock is.
+        """
+        postings = [
+            np.frombuffer(self._postings[feature], dtype=np.int32)
+            for feature in features if feature in self._postings
+        ]
+        if not postings:
+            return None
+        rows, overlap = np.unique(np.concatenate(postings), return_counts=True)
+        return rows, overlap, np.frombuffer(self._sizes, dtype=np.int32)[rows]
+
+    def search(self, name, top_k=1, min_similarity=0.0):
+        """
+        Most similar stored names to `name` that pass same_words
+
+        Returns: List of (ingredient_name, similarity) tuples, best first
+        """
+        normalized = normalize_name(name)
+        if top_k == 1:
+            row = self._normalized.get(normalized)
+            if row is not None:
+                return [(self._names[row], 1.0)]
+        features = self._features(normalized)
+        if not features:
+            return []
+
+        with self._lock:
+            counted = self._count_overlap(features)
+            names = self._names
+        if counted is None:
+            return []
+        rows, overlap, sizes = counted
+
+        scores = overlap / np.sqrt(sizes * float(len(features)))
+        candidates = np.flatnonzero(scores >= min_similarity)
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        results = []
+        for i in candidates:
+            match = names[rows[i]]
+            if not same_words(normalized, normalize_name(match)):
+                continue
+            results.append((match, float(scores[i])))
+            if len(results) == top_k:
+                break
+        return results
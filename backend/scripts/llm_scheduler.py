@@ -0,0 +1,134 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class BatchScheduler:
+    """
+    Micro-batching scheduler for LLM ingredient lookups
+
+    Jobs submit single ingredients and get a Future back. A collector thread
+    gathers submissions from every job for up to `window` seconds after the
+    first one arrives (or until `max_batch` are waiting), then hands the
+    whole batch to `learn_batch(ingredients, model)` on `executor` and fans
+    the answers back out to each Future.
+
+    Collection continues while earlier batches are still waiting on the LLM.
+    """
+
+    def __init__(self, learn_batch, model, executor, window=0.05, max_batch=10):
+        self.learn_batch = learn_batch
+        self.model = model
+        self.executor = executor
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._running = False
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="llm-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop collecting; anything already queued is still dispatched"""
+        if not self._running:
+            return
+        self._running = False
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def submit(self, ingredient):
+        """Queue one ingredient; returns a Future resolving to its dietary flags"""
+        if not self._running:
+            raise RuntimeError("LLM batch scheduler is not running")
+        future = Future()
+        self._queue.put((ingredient, future))
+        return future
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._dispatch(batch)
+
+        # Drain anything submitted while stopping
+        leftovers = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                leftovers.append(item)
+        for i in range(0, len(leftovers), self.max_batch):
+            self._dispatch(leftovers[i:i + self.max_batch])
+
+    def _dispatch(self, batch):
+        waiters = {}
+        for ingredient, future in batch:
+            waiters.setdefault(ingredient, []).append(future)
+        with self._stats_lock:
+            self.batches += 1
+            self.items += len(waiters)
+
+        def fan_out(done):
+            try:
+                learned = done.result()
+            except Exception as e:
+                for futures in waiters.values():
+                    for future in futures:
+                        future.set_exception(e)
+                return
+            for ingredient, futures in waiters.items():
+                for future in futures:
+                    if ingredient in learned:
+                        future.set_result(learned[ingredient])
+                    else:
+                        future.set_exception(KeyError(ingredient))
+
+        try:
+            self.executor.submit(self.learn_batch, list(waiters), self.model).add_done_callback(fan_out)
+        except Exception as e:
+            for futures in waiters.values():
+                for future in futures:
+                    future.set_exception(e)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "running": self._running,
+                "window_ms": int(self.window * 1000),
+                "max_batch": self.max_batch,
+                "batches": self.batches,
+                "ingredients": self.items,
+                "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0,
+                "queued": self._queue.qsize()
+            }
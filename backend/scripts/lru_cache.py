@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by get() for keys that are not cached (None is a valid cached value)
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with hit-rate counters
+
+    Holds at most `max_entries` values (0 disables caching). With `ttl`
+    set, entries also expire that many seconds after being stored, which
+    bounds how stale a worker can get when another process changes the data.
+
+    `generation` moves on every invalidate() and clear(). A reader that
+    captures it before loading a value and passes it to put() stores nothing
+    if the data was invalidated meanwhile, so a value read just before a
+    write can't outlive the write's invalidation.
+    """
+
+    def __init__(self, max_entries=10000, ttl=None, name="cache"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.name = name
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.generation = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._entries[key]
+            return MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def get(self, key, default=MISSING):
+        """Cached value for key, or `default` if absent/expired"""
+        with self._lock:
+            value = self._lookup(key, time.monotonic())
+            if value is MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def get_many(self, keys):
+        """Return {key: value} for the keys that are cached"""
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                value = self._lookup(key, now)
+                if value is not MISSING:
+                    found[key] = value
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, key, value, generation=None):
+        self.put_many({key: value}, generation)
+
+    def put_many(self, items, generation=None):
+        """
+        Store several key/value pairs, evicting the least recently used
+
+        With `generation` (a value of self.generation read before loading
+        them), nothing is stored if an invalidation happened since.
+        """
+        if self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            for key, value in items.items():
+                self._entries[key] = (value, expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self.generation += 1
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
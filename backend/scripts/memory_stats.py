@@ -0,0 +1,84 @@
+"""
+Resident memory of this process, or of a gunicorn master and its workers
+
+RSS counts shared pages (preloaded model, mapped index) in every process
+that touches them, so it overstates the real cost of a worker. PSS splits
+each shared page between the processes sharing it; the PSS of all
+processes adds up to their real footprint. Linux only (reads /proc).
+
+Usage (from backend/):
+    python -m scripts.memory_stats <gunicorn master pid>
+"""
+import os
+import sys
+
+
+def process_memory(pid="self"):
+    """
+    Memory of one process in MB
+
+    Returns: Dict with rss, pss, shared (clean + dirty pages also mapped by
+             other processes) and private, or {} if /proc is unavailable
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    except OSError:
+        return {}
+    return {
+        "pid": os.getpid() if pid == "self" else int(pid),
+        "rss_mb": round(fields.get("Rss", 0), 1),
+        "pss_mb": round(fields.get("Pss", 0), 1),
+        "shared_mb": round(fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0), 1),
+        "private_mb": round(fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0), 1)
+    }
+
+
+def child_pids(pid):
+    """Direct children of a process"""
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return children
+
+
+def format_memory(stats):
+    """One-line summary of process_memory() output"""
+    if not stats:
+        return "memory stats unavailable (no /proc/<pid>/smaps_rollup)"
+    return (f"rss {stats['rss_mb']:.0f} MB, pss {stats['pss_mb']:.0f} MB "
+            f"(shared {stats['shared_mb']:.0f} MB, private {stats['private_mb']:.0f} MB)")
+
+
+def main():
+    if len(sys.argv) != 2:
+        sys.exit("Usage: python -m scripts.memory_stats <gunicorn master pid>")
+    master = int(sys.argv[1])
+    processes = [("master", master)] + [("worker", pid) for pid in child_pids(master)]
+
+    total_rss = total_pss = 0.0
+    measured = 0
+    for role, pid in processes:
+        stats = process_memory(pid)
+        print(f"{role:6} {pid:>7}  {format_memory(stats)}")
+        if not stats:
+            continue
+        measured += 1
+        total_rss += stats["rss_mb"]
+        total_pss += stats["pss_mb"]
+    if not measured:
+        sys.exit("No memory stats could be read (Linux /proc only)")
+    print(f"total  {measured} of {len(processes)} processes  rss {total_rss:.0f} MB "
+          f"(double-counts shared pages), pss {total_pss:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
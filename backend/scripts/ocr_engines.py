@@ -0,0 +1,105 @@
+import threading
+import time
+
+from scripts.paddle_ocr import parse_ingredients_regex, parse_ingredients_with_gemini
+
+
+def _load_gemini():
+    from scripts.extract_label import extract_label
+
+    def extract(image_path, model):
+        if model is None:
+            raise RuntimeError("Gemini OCR needs the Gemini model (is API_KEY set?)")
+        return extract_label(model, image_path)
+    return extract
+
+
+def _load_paddle():
+    from scripts import paddle_ocr
+    paddle_ocr.get_ocr()
+
+    def extract(image_path, model):
+        # Gemini only parses the OCR'd text when available; regexes otherwise
+        if model is None:
+            return paddle_ocr.extract_ingredients_paddle_only(image_path)
+        return paddle_ocr.extract_ingredients_with_paddle(image_path, model)
+    return extract
+
+
+def _load_tesseract():
+    from scripts.tess_ocr import extract_text_with_tesseract
+
+    def extract(image_path, model):
+        text = extract_text_with_tesseract(image_path)
+        if model is None:
+            return parse_ingredients_regex(text)
+        return parse_ingredients_with_gemini(text, model)
+    return extract
+
+
+# Engine name -> loader. A loader does the engine's imports/initialization and
+# returns extract(image_path, model) -> comma-separated ingredients text
+OCR_ENGINES = {
+    "gemini": _load_gemini,
+    "paddle": _load_paddle,
+    "tesseract": _load_tesseract,
+}
+
+_loaded = {}  # name -> extract function
+_load_stats = {}  # name -> {"load_seconds", "error"}
+_load_lock = threading.Lock()
+
+
+def get_ocr_engine(name):
+    """
+    Extract function of an OCR engine, importing and initializing it on first use
+
+    Engines are loaded once per process; how long that took is logged and
+    kept for ocr_engine_stats(). A failed load is retried on the next call.
+    """
+    if name not in OCR_ENGINES:
+        raise ValueError(f"Unknown OCR engine: {name} (expected one of {', '.join(OCR_ENGINES)})")
+    engine = _loaded.get(name)
+    if engine is not None:
+        return engine
+
+    with _load_lock:
+        if name in _loaded:
+            return _loaded[name]
+        start = time.perf_counter()
+        try:
+            engine = OCR_ENGINES[name]()
+        except Exception as e:
+            seconds = time.perf_counter() - start
+            _load_stats[name] = {"load_seconds": round(seconds, 3), "error": str(e)}
+            print(f"❌ OCR engine {name} failed to load after {seconds:.2f}s: {e}")
+            raise
+        seconds = time.perf_counter() - start
+        _loaded[name] = engine
+        _load_stats[name] = {"load_seconds": round(seconds, 3), "error": None}
+        print(f"🔤 OCR engine {name} loaded in {seconds:.2f}s")
+        return engine
+
+
+def warm_up_ocr_engines(names):
+    """Load the given engines now instead of on first request; failures are logged, not raised"""
+    for name in names:
+        try:
+            get_ocr_engine(name)
+        except ValueError as e:
+            print(f"❌ {e}")
+        except Exception:
+            pass  # already logged by get_ocr_engine
+
+
+def extract_ingredients(image_path, engine="gemini", model=None):
+    """Comma-separated ingredients text from a label image, using the named engine"""
+    return get_ocr_engine(engine)(image_path, model)
+
+
+def ocr_engine_stats():
+    """Which engines are loaded and how long each took to import/initialize"""
+    return {
+        name: {"loaded": name in _loaded, **_load_stats.get(name, {})}
+        for name in OCR_ENGINES
+    }
@@ -1,12 +1,35 @@
 # Install: pip install paddleocr paddlepaddle
 
-from paddleocr import PaddleOCR
 import re
+import threading
 
-# Initialize PaddleOCR (do this once at startup)
-ocr = PaddleOCR(use_angle_cls=True, lang='en', show_log=False)
+# PaddleOCR instance, built on first use (importing paddleocr alone takes seconds)
+_ocr = None
+_ocr_lock = threading.Lock()
 
-def extract_ingredients_with_paddle(image_path):
+def get_ocr():
+    """Lazy load PaddleOCR (once per process)"""
+    global _ocr
+    if _ocr is None:
+        with _ocr_lock:
+            if _ocr is None:
+                from paddleocr import PaddleOCR
+                _ocr = PaddleOCR(use_angle_cls=True, lang='en', show_log=False)
+    return _ocr
+
+def extract_text_with_paddle(image_path, min_confidence=0.7):
+    """Run PaddleOCR and return its high-confidence lines"""
+    result = get_ocr().ocr(image_path, cls=True)
+    
+    lines = []
+    for line in result[0] or []:
+        text = line[1][0]  # Get the text content
+        confidence = line[1][1]  # Get confidence score
+        if confidence > min_confidence:
+            lines.append(text)
+    return lines
+
+def extract_ingredients_with_paddle(image_path, model):
     """
     Fast ingredient extraction using PaddleOCR + Gemini for parsing
     
@@ -17,21 +40,14 @@ def extract_ingredients_with_paddle(image_path):
     This is 5-10x faster than using Gemini for OCR
     """
     # Step 1: Fast OCR with PaddleOCR
-    result = ocr.ocr(image_path, cls=True)
-    
-    # Extract all text
-    extracted_text = []
-    for line in result[0]:
-        text = line[1][0]  # Get the text content
-        confidence = line[1][1]  # Get confidence score
-        
-        # Only include high-confidence results
-        if confidence > 0.7:
-            extracted_text.append(text)
-    
-    full_text = "\n".join(extracted_text)
+    full_text = "\n".join(extract_text_with_paddle(image_path))
     
     # Step 2: Use Gemini to intelligently parse ingredients
+    return parse_ingredients_with_gemini(full_text, model)
+
+
+def parse_ingredients_with_gemini(full_text, model):
+    """Ask Gemini for the comma-separated ingredients in OCR'd label text"""
     # This is much faster since Gemini only processes text, not image
     prompt = f"""From this product label text, extract ONLY the ingredients list.
 
@@ -61,17 +77,13 @@ def extract_ingredients_paddle_only(image_path):
     Uses regex to find ingredient lists. Fastest but less accurate.
     Good for simple, well-formatted labels.
     """
-    result = ocr.ocr(image_path, cls=True)
-    
-    # Extract all text
-    all_text = []
-    for line in result[0]:
-        text = line[1][0]
-        confidence = line[1][1]
-        if confidence > 0.7:
-            all_text.append(text.lower())
-    
-    full_text = " ".join(all_text)
+    full_text = " ".join(extract_text_with_paddle(image_path))
+    return parse_ingredients_regex(full_text)
+
+
+def parse_ingredients_regex(full_text):
+    """Find the ingredients section of OCR'd label text with regexes (no Gemini)"""
+    full_text = re.sub(r"\s+", " ", full_text.lower())
     
     # Find ingredients section using common patterns
     patterns = [
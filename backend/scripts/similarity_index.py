@@ -0,0 +1,558 @@
+import json
+import os
+import threading
+import numpy as np
+
+from scripts.dietary_flags import decode_flags, encode_flags, mask_dtype
+from scripts.embedding_codec import check_dtype, dequantize, quantize
+
+# Bumped when the on-disk layout written by save() changes
+SNAPSHOT_FORMAT = 3
+
+# Quantized rows are converted to float32 this many at a time for scoring
+SCORE_CHUNK_ROWS = 4096
+
+
+def _score(block, other):
+    """block @ other in float32, without converting all of a quantized block at once"""
+    if block.dtype == np.float32:
+        return block @ other
+    parts = [
+        block[start:start + SCORE_CHUNK_ROWS].astype(np.float32) @ other
+        for start in range(0, len(block), SCORE_CHUNK_ROWS)
+    ]
+    if not parts:
+        return np.zeros((0,) + other.shape[1:], dtype=np.float32)
+    return np.concatenate(parts)
+
+
+class _Rows:
+    """
+    Read-only view of the index matrix: loaded base rows, then added rows
+
+    The base segment is usually a read-only memory map of the saved
+    snapshot, so scoring it never copies it into process memory. Rows may
+    be quantized (see embedding_codec); `scales` then holds the per-row
+    int8 factors and results are always float32.
+    """
+
+    def __init__(self, base, tail, scales=None):
+        self.base = base
+        self.tail = tail
+        self.scales = scales
+        self.shape = (len(base) + len(tail), tail.shape[1])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def dot(self, other):
+        """self @ other, without joining the segments"""
+        if not len(self.base):
+            scores = _score(self.tail, other)
+        else:
+            scores = np.concatenate([_score(self.base, other), _score(self.tail, other)])
+        if self.scales is not None:
+            scores *= self.scales.reshape((-1,) + (1,) * (scores.ndim - 1))
+        return scores
+
+    def take(self, rows):
+        """float32 copy of the given rows"""
+        rows = np.asarray(rows)
+        if not len(self.base):
+            values = self.tail[rows]
+        else:
+            in_base = rows < len(self.base)
+            values = np.empty((len(rows), self.shape[1]), dtype=self.tail.dtype)
+            values[in_base] = self.base[rows[in_base]]
+            values[~in_base] = self.tail[rows[~in_base] - len(self.base)]
+        return dequantize(values, None if self.scales is None else self.scales[rows])
+
+
+class EmbeddingIndex:
+    """
+    Process-resident similarity index over ingredient embeddings (exact search)
+
+    Holds one contiguous float32 matrix of L2-normalized embeddings plus
+    parallel arrays of ingredient names and dietary flags, so a lookup is a
+    single matrix-vector product instead of a table scan.
+
+    Flags are stored as two bitmasks per row (see dietary_flags): which
+    flags pass, and which are known at all (NULL in the database is unknown).
+
+    An index loaded from disk keeps the saved vectors as a read-only "base"
+    segment (memory-mapped by default, so workers share the pages through
+    the OS cache); rows added afterwards go to an in-memory segment.
+    `generation` records how far the index is caught up with the database,
+    and `embedding_model` which model produced its vectors.
+
+    With dtype "float16" or "int8" (per-row scaled) the vectors are held
+    quantized, cutting matrix memory 2x or ~4x; scores are still computed
+    in float32.
+    """
+
+    backend = "flat"
+
+    def __init__(self, flag_keys, dim=None, initial_capacity=1024, dtype="float32"):
+        self.flag_keys = tuple(flag_keys)
+        self.dim = dim
+        self.dtype = check_dtype(dtype)
+        self._lock = threading.Lock()
+        self._names = []
+        self._positions = {}  # name -> row in the matrix
+        self._size = 0
+        self._capacity = 0
+        self._initial_capacity = initial_capacity
+        self.generation = 0
+        self.embedding_model = None
+        self._base = np.zeros((0, dim or 0), dtype=self.dtype)  # rows [0, len(_base))
+        self._matrix = None  # rows [len(_base), capacity)
+        self._scales = None  # int8 only: per-row scale, all rows
+        self._pass_masks = None
+        self._known_masks = None
+        if dim is not None:
+            self._allocate(dim, initial_capacity)
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    def names(self, start=0):
+        """Names of every stored ingredient (from row `start` on), in row order"""
+        with self._lock:
+            return list(self._names[start:self._size])
+
+    def masks(self, name):
+        """(pass_mask, known_mask) of a stored ingredient, or None"""
+        with self._lock:
+            row = self._positions.get(name)
+            if row is None:
+                return None
+            return int(self._pass_masks[row]), int(self._known_masks[row])
+
+    def nbytes(self):
+        """Memory taken by the stored vectors (and int8 scales)"""
+        itemsize = np.dtype(self.dtype).itemsize
+        scale_bytes = 4 if self.dtype == "int8" else 0
+        return self._size * ((self.dim or 0) * itemsize + scale_bytes)
+
+    def _allocate(self, dim, capacity):
+        """Grow the backing arrays, keeping existing rows (the base segment is never copied)"""
+        base_size = len(self._base)
+        matrix = np.zeros((capacity - base_size, dim), dtype=self.dtype)
+        pass_masks = np.zeros(capacity, dtype=mask_dtype(self.flag_keys))
+        known_masks = np.zeros(capacity, dtype=mask_dtype(self.flag_keys))
+        scales = np.ones(capacity, dtype=np.float32) if self.dtype == "int8" else None
+        if self._matrix is not None and self._size:
+            matrix[:self._size - base_size] = self._matrix[:self._size - base_size]
+            pass_masks[:self._size] = self._pass_masks[:self._size]
+            known_masks[:self._size] = self._known_masks[:self._size]
+            if scales is not None:
+                scales[:self._size] = self._scales[:self._size]
+        self.dim = dim
+        self._matrix = matrix
+        self._scales = scales
+        self._pass_masks = pass_masks
+        self._known_masks = known_masks
+        self._capacity = capacity
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add(self, name, embedding, properties):
+        """Insert or replace a single ingredient"""
+        self.add_many([name], [embedding], [properties])
+
+    def add_many(self, names, embeddings, properties_list=None, masks=None):
+        """
+        Insert or replace several ingredients at once
+
+        Args:
+            names: List of ingredient names
+            embeddings: Sequence/array of raw (unnormalized) embeddings
+            properties_list: List of dietary flag dicts, parallel to names
+            masks: Instead of properties_list, a (pass_masks, known_masks) pair
+                   of sequences parallel to names
+        """
+        if not names:
+            return
+        vectors = self._normalize(np.vstack(embeddings))
+        values, scales = quantize(vectors, self.dtype)
+        if masks is None:
+            masks = zip(*[encode_flags(properties, self.flag_keys) for properties in properties_list])
+        pass_masks, known_masks = masks
+
+        with self._lock:
+            if self._matrix is None:
+                self._allocate(vectors.shape[1], max(self._initial_capacity, len(names)))
+
+            rows = []
+            for i, (name, pass_mask, known_mask) in enumerate(zip(names, pass_masks, known_masks)):
+                row = self._positions.get(name)
+                if row is None:
+                    if self._size == self._capacity:
+                        self._allocate(self.dim, self._capacity * 2)
+                    row = self._size
+                    self._names.append(name)
+                    self._positions[name] = row
+                    self._size += 1
+                # Base rows are read-only; their vector is a function of the
+                # name, so re-adding an ingredient only changes its flags
+                if row >= len(self._base):
+                    self._matrix[row - len(self._base)] = values[i]
+                    if scales is not None:
+                        self._scales[row] = scales[i]
+                self._pass_masks[row] = pass_mask
+                self._known_masks[row] = known_mask
+                rows.append(row)
+            self._on_rows_written(np.asarray(rows), vectors)
+
+    def _on_rows_written(self, rows, vectors):
+        """Hook for subclasses that maintain extra per-row structures"""
+
+    def clear(self):
+        """Drop every entry (keeps the allocated capacity)"""
+        with self._lock:
+            self._names = []
+            self._positions = {}
+            self._size = 0
+            if len(self._base):
+                self._base = np.zeros((0, self.dim), dtype=self.dtype)
+                self._allocate(self.dim, self._capacity)
+
+    def _top_k(self, scores, rows, names, masks, top_k, min_similarity, decode=True):
+        """Pick the best top_k of the scored rows, best match first"""
+        # Quantized (and float32 rounding) dot products of unit vectors can land
+        # just outside [-1, 1]; similarities returned and thresholded are cosines
+        scores = np.clip(scores, -1.0, 1.0)
+        k = min(top_k, len(rows))
+        if k == 0:
+            return []
+        if k < len(rows):
+            best = np.argpartition(-scores, k - 1)[:k]
+        else:
+            best = np.arange(len(rows))
+        best = best[np.argsort(-scores[best])]
+
+        results = []
+        for i in best:
+            similarity = float(scores[i])
+            if similarity < min_similarity:
+                break
+            row = rows[i]
+            flags = (int(masks[0][row]), int(masks[1][row]))
+            if decode:
+                flags = decode_flags(*flags, self.flag_keys)
+            results.append((names[row], similarity, flags))
+        return results
+
+    def _snapshot(self, size):
+        """Views of the live rows; call with the lock held"""
+        scales = None if self._scales is None else self._scales[:size]
+        rows = _Rows(self._base, self._matrix[:size - len(self._base)], scales)
+        return rows, (self._pass_masks[:size], self._known_masks[:size]), self._names[:size]
+
+    def search(self, query_embedding, top_k=5, min_similarity=0.0, decode=True):
+        """
+        Find the most similar stored ingredients
+
+        Returns: List of (ingredient_name, similarity_score, properties) tuples,
+                 best match first. With decode=False, properties is the raw
+                 (pass_mask, known_mask) pair instead of a dict.
+        """
+        with self._lock:
+            size = self._size
+            if size == 0:
+                return []
+            matrix, masks, names = self._snapshot(size)
+
+        query = self._normalize(query_embedding)
+        scores = matrix.dot(query)
+        return self._top_k(scores, np.arange(size), names, masks, top_k, min_similarity, decode)
+
+    def search_many(self, query_embeddings, top_k=5, min_similarity=0.0, decode=True):
+        """
+        Score several queries against the index with one matrix product
+
+        Returns: One result list (as for search) per query, in query order
+        """
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+        if len(query_embeddings) == 0:
+            return []
+        with self._lock:
+            size = self._size
+            if size == 0:
+                return [[] for _ in query_embeddings]
+            matrix, masks, names = self._snapshot(size)
+
+        queries = self._normalize(query_embeddings)
+        scores = matrix.dot(queries.T)  # (size, num_queries)
+        rows = np.arange(size)
+        return [
+            self._top_k(scores[:, i], rows, names, masks, top_k, min_similarity, decode)
+            for i in range(len(queries))
+        ]
+
+    # ---------- persistence ----------
+
+    def _extra_state(self):
+        """Extra arrays/metadata a subclass wants saved alongside the matrix"""
+        return {}, {}
+
+    def _restore_extra_state(self, arrays, meta):
+        pass
+
+    def save(self, path):
+        """
+        Write the index to a directory (one .npy per array + names/metadata JSON)
+
+        Files are written to a temporary directory and swapped in, so a
+        worker loading concurrently never sees a half-written index. Workers
+        that have the previous files mapped keep reading them until they
+        reload (the old inodes live on until unmapped).
+        """
+        with self._lock:
+            size = self._size
+            dtype = mask_dtype(self.flag_keys)
+            if size:
+                rows, masks, _ = self._snapshot(size)
+            else:
+                empty = np.zeros((0, self.dim or 0), self.dtype)
+                rows = _Rows(empty, empty, None if self.dtype != "int8" else np.zeros(0, np.float32))
+                masks = (np.zeros(0, dtype), np.zeros(0, dtype))
+            arrays = {"pass_masks": masks[0].copy(), "known_masks": masks[1].copy()}
+            if rows.scales is not None:
+                arrays["scales"] = rows.scales.copy()
+            extra_arrays, extra_meta = self._extra_state()
+            arrays.update(extra_arrays)
+            meta = {
+                "format": SNAPSHOT_FORMAT,
+                "backend": self.backend,
+                "dim": self.dim,
+                "size": size,
+                "dtype": self.dtype,
+                "generation": self.generation,
+                "embedding_model": self.embedding_model,
+                "flag_keys": list(self.flag_keys),
+                **extra_meta
+            }
+            names = list(self._names[:size])
+
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        os.makedirs(tmp_path, exist_ok=True)
+        # Written segment by segment so a mapped base is never copied into memory
+        matrix = np.lib.format.open_memmap(
+            os.path.join(tmp_path, "matrix.npy"), mode="w+", dtype=self.dtype, shape=rows.shape
+        )
+        if len(rows.base):
+            matrix[:len(rows.base)] = rows.base
+        matrix[len(rows.base):] = rows.tail
+        matrix.flush()
+        del matrix
+        for array_name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{array_name}.npy"), array)
+        with open(os.path.join(tmp_path, "names.json"), "w") as f:
+            json.dump(names, f)
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        old_path = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        if os.path.exists(old_path):
+            for filename in os.listdir(old_path):
+                os.remove(os.path.join(old_path, filename))
+            os.rmdir(old_path)
+
+    @staticmethod
+    def read_meta(path):
+        """Metadata of a saved index (backend, size, generation, ...) without loading it"""
+        with open(os.path.join(path, "meta.json")) as f:
+            return json.load(f)
+
+    @classmethod
+    def load(cls, path, mmap=True, **options):
+        """
+        Load an index saved with save(); returns an instance of the saved backend
+
+        With mmap=True the vectors are mapped read-only instead of read into
+        memory, so loading is near-instant and every worker mapping the same
+        files shares one copy of them.
+        """
+        meta = cls.read_meta(path)
+        with open(os.path.join(path, "names.json")) as f:
+            names = json.load(f)
+
+        index_cls = INDEX_BACKENDS[meta["backend"]]
+        index = index_cls(meta["flag_keys"], **{**options, "dtype": meta.get("dtype", "float32")})
+        arrays = {
+            filename[:-4]: np.load(os.path.join(path, filename))
+            for filename in os.listdir(path) if filename.endswith(".npy") and filename != "matrix.npy"
+        }
+
+        size = meta["size"]
+        base = np.load(os.path.join(path, "matrix.npy"), mmap_mode="r" if mmap and size else None)
+        if not mmap:
+            base.setflags(write=False)
+        index._base = base
+        index._allocate(meta["dim"], max(index._initial_capacity, size))
+        if "flags" in arrays:
+            # Snapshot from before the bitmask layout: int8 flags, -1 = unknown
+            flags = arrays["flags"]
+            bits = 1 << np.arange(flags.shape[1])
+            index._pass_masks[:size] = ((flags == 1) * bits).sum(axis=1)
+            index._known_masks[:size] = ((flags >= 0) * bits).sum(axis=1)
+        else:
+            index._pass_masks[:size] = arrays["pass_masks"]
+            index._known_masks[:size] = arrays["known_masks"]
+        if "scales" in arrays:
+            index._scales[:size] = arrays["scales"]
+        index._names = names
+        index._positions = {name: row for row, name in enumerate(names)}
+        index._size = size
+        index.generation = meta.get("generation", 0)
+        index.embedding_model = meta.get("embedding_model")
+        index._restore_extra_state(arrays, meta)
+        return index
+
+
+class IVFFlatIndex(EmbeddingIndex):
+    """
+    Approximate index: inverted file over k-means cells, exact scoring inside cells
+
+    Vectors are clustered into `nlist` cells. A query scores the centroids,
+    then only the rows in the `nprobe` closest cells. Raising nprobe trades
+    latency for recall (nprobe == nlist is an exact search).
+
+    Until the index holds `train_threshold` rows it behaves like the flat
+    index; centroids are trained on first search after that and retrained
+    whenever the index has doubled since the last training.
+    """
+
+    backend = "ivf"
+
+    def __init__(self, flag_keys, dim=None, initial_capacity=1024, dtype="float32",
+                 nlist=None, nprobe=10, train_threshold=4096, train_sample=50000):
+        super().__init__(flag_keys, dim=dim, initial_capacity=initial_capacity, dtype=dtype)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.train_sample = train_sample
+        self._centroids = None
+        self._assignments = np.zeros(self._capacity, dtype=np.int32)
+        self._trained_size = 0
+
+    def _allocate(self, dim, capacity):
+        super()._allocate(dim, capacity)
+        assignments = np.zeros(capacity, dtype=np.int32)
+        if getattr(self, "_assignments", None) is not None and self._size:
+            assignments[:self._size] = self._assignments[:self._size]
+        self._assignments = assignments
+
+    def _on_rows_written(self, rows, vectors):
+        if self._centroids is not None:
+            self._assignments[rows] = np.argmax(vectors @ self._centroids.T, axis=1)
+
+    def clear(self):
+        super().clear()
+        with self._lock:
+            self._centroids = None
+            self._trained_size = 0
+
+    def _needs_training(self):
+        if self._size < self.train_threshold:
+            return False
+        return self._centroids is None or self._size >= 2 * self._trained_size
+
+    def train(self, iterations=10, seed=0):
+        """Run spherical k-means over (a sample of) the stored vectors"""
+        with self._lock:
+            size = self._size
+            if size == 0:
+                return
+            vectors, _, _ = self._snapshot(size)
+            nlist = self.nlist or max(1, int(np.sqrt(size)))
+            nlist = min(nlist, size)
+
+            rng = np.random.default_rng(seed)
+            if size > self.train_sample:
+                sample = vectors.take(np.sort(rng.choice(size, self.train_sample, replace=False)))
+            else:
+                sample = vectors.take(np.arange(size))
+            centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+            for _ in range(iterations):
+                assign = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assign, sample)
+                counts = np.bincount(assign, minlength=nlist)
+                filled = counts > 0
+                centroids[filled] = self._normalize(sums[filled])
+
+            self._centroids = centroids
+            self._assignments[:size] = np.argmax(vectors.dot(centroids.T), axis=1)
+            self._trained_size = size
+
+    def search(self, query_embedding, top_k=5, min_similarity=0.0, decode=True):
+        if self._needs_training():
+            self.train()
+
+        with self._lock:
+            size = self._size
+            if size == 0:
+                return []
+            centroids = self._centroids
+            matrix, masks, names = self._snapshot(size)
+            assignments = self._assignments[:size]
+
+        if centroids is None:
+            return super().search(query_embedding, top_k=top_k, min_similarity=min_similarity, decode=decode)
+
+        query = self._normalize(query_embedding)
+        nprobe = min(self.nprobe, len(centroids))
+        probe = np.argpartition(-(centroids @ query), nprobe - 1)[:nprobe]
+        rows = np.flatnonzero(np.isin(assignments, probe))
+        scores = matrix.take(rows) @ query
+        return self._top_k(scores, rows, names, masks, top_k, min_similarity, decode)
+
+    def search_many(self, query_embeddings, top_k=5, min_similarity=0.0, decode=True):
+        # Each query probes its own cells, so there is no shared product to batch
+        if self._centroids is None and not self._needs_training():
+            return super().search_many(query_embeddings, top_k=top_k, min_similarity=min_similarity, decode=decode)
+        return [
+            self.search(query, top_k=top_k, min_similarity=min_similarity, decode=decode)
+            for query in query_embeddings
+        ]
+
+    def _extra_state(self):
+        if self._centroids is None:
+            return {}, {"trained_size": 0}
+        return (
+            {"centroids": self._centroids, "assignments": self._assignments[:self._size]},
+            {"trained_size": self._trained_size}
+        )
+
+    def _restore_extra_state(self, arrays, meta):
+        if "centroids" in arrays:
+            self._centroids = arrays["centroids"]
+            self._assignments[:self._size] = arrays["assignments"]
+            self._trained_size = meta["trained_size"]
+
+
+# Available index backends, selected with SIMILARITY_INDEX_BACKEND
+INDEX_BACKENDS = {
+    "flat": EmbeddingIndex,
+    "ivf": IVFFlatIndex,
+}
+
+def create_index(flag_keys, backend="flat", **options):
+    """Create an empty index of the requested backend"""
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown similarity index backend: {backend}")
+    return INDEX_BACKENDS[backend](flag_keys, **options)
@@ -0,0 +1,106 @@
+import threading
+import time
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent work for the same key onto one in-flight call
+
+    A caller claims a set of keys. Keys nobody is working on become "owned"
+    and the caller must publish a result for each with resolve() or fail().
+    Keys already in flight come back as futures to wait on. Results are kept
+    for `recent_ttl` seconds so a job that missed the database just before
+    another job stored the answer does not repeat the work.
+
+    Counters:
+        hits: keys served from a recently completed call
+        misses: keys the caller had to compute itself
+        coalesced: keys that joined a call already in flight
+    """
+
+    def __init__(self, recent_ttl=60.0):
+        self.recent_ttl = recent_ttl
+        self._lock = threading.Lock()
+        self._in_flight = {}  # key -> Future
+        self._recent = {}  # key -> (value, expires_at)
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _purge_expired(self, now):
+        expired = [key for key, (_, expires_at) in self._recent.items() if expires_at <= now]
+        for key in expired:
+            del self._recent[key]
+
+    def claim(self, keys):
+        """
+        Claim keys for computation
+
+        Returns: (owned, shared)
+            - owned: List of keys this caller must compute and publish
+            - shared: Dict of {key: Future} for keys computed elsewhere
+        """
+        owned = []
+        shared = {}
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            for key in dict.fromkeys(keys):
+                if key in self._recent:
+                    future = Future()
+                    future.set_result(self._recent[key][0])
+                    shared[key] = future
+                    self.hits += 1
+                elif key in self._in_flight:
+                    shared[key] = self._in_flight[key]
+                    self.coalesced += 1
+                else:
+                    self._in_flight[key] = Future()
+                    owned.append(key)
+                    self.misses += 1
+        return owned, shared
+
+    def peek(self, keys):
+        """Return {key: value} for keys with a recently completed result, without claiming any"""
+        found = {}
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            for key in dict.fromkeys(keys):
+                if key in self._recent:
+                    found[key] = self._recent[key][0]
+            self.hits += len(found)
+        return found
+
+    def resolve(self, key, value):
+        """Publish the result for an owned key and wake every waiter"""
+        with self._lock:
+            future = self._in_flight.pop(key, None)
+            self._recent[key] = (value, time.monotonic() + self.recent_ttl)
+        if future is not None:
+            future.set_result(value)
+
+    def fail(self, key, exc):
+        """Publish a failure for an owned key (not cached, so the next caller retries)"""
+        with self._lock:
+            future = self._in_flight.pop(key, None)
+        if future is not None:
+            future.set_exception(exc)
+
+    def forget(self, key=None):
+        """Drop cached results (one key, or all of them)"""
+        with self._lock:
+            if key is None:
+                self._recent.clear()
+            else:
+                self._recent.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight),
+                "recent": len(self._recent)
+            }
@@ -0,0 +1,77 @@
+import threading
+import time
+
+
+class WarmUp:
+    """
+    Runs a list of warm-up steps once, in a background thread
+
+    Each step is a (name, fn) pair, run in order. A failing step is logged
+    and recorded, and the remaining steps still run, since whatever it was
+    warming will be loaded lazily on first use anyway.
+
+    state is "idle" before start(), "warming" while steps run, then
+    "ready" (or "failed" if any step raised).
+    """
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.state = "idle"
+        self._lock = threading.Lock()
+        self._thread = None
+        self._results = {}  # step name -> {"seconds", "error"}
+        self._started_at = None
+        self._seconds = None
+
+    @property
+    def warming(self):
+        return self.state == "warming"
+
+    def start(self):
+        """Start warming up (no-op if already started)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.state = "warming"
+            self._started_at = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name="warm-up", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        failed = False
+        for name, fn in self.steps:
+            start = time.perf_counter()
+            error = None
+            try:
+                fn()
+            except Exception as e:
+                error = str(e)
+                failed = True
+                print(f"❌ Warm-up step {name} failed: {e}")
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self._results[name] = {"seconds": round(seconds, 3), "error": error}
+            if error is None:
+                print(f"🔥 Warm-up step {name} took {seconds:.2f}s")
+        with self._lock:
+            self._seconds = time.monotonic() - self._started_at
+            self.state = "failed" if failed else "ready"
+        print(f"🔥 Warm-up {self.state} after {self._seconds:.2f}s")
+
+    def wait(self, timeout=None):
+        """Block until warm-up finishes; returns False on timeout"""
+        if self._thread is None:
+            return True
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def stats(self):
+        with self._lock:
+            elapsed = self._seconds
+            if elapsed is None and self._started_at is not None:
+                elapsed = time.monotonic() - self._started_at
+            return {
+                "state": self.state,
+                "seconds": round(elapsed, 3) if elapsed is not None else None,
+                "steps": dict(self._results)
+            }
@@ -203,7 +203,63 @@ const Home = ({ navigation }) => {
         });
       };
 
-      const resultsData = await pollResults();
+      // Stream progress over Server-Sent Events (read through XHR, since React
+      // Native has no EventSource); falls back to polling if the stream fails
+      const streamResults = () => {
+        return new Promise((resolve, reject) => {
+          const xhr = new XMLHttpRequest();
+          let seen = 0;
+          let settled = false;
+
+          const finish = (fn, value) => {
+            if (!settled) {
+              settled = true;
+              clearTimeout(timeout);
+              xhr.abort();
+              fn(value);
+            }
+          };
+
+          const parseEvents = () => {
+            const text = xhr.responseText;
+            const end = text.lastIndexOf("\n\n");
+            if (end < seen) return;
+            const messages = text.slice(seen, end).split("\n\n");
+            seen = end + 2;
+
+            for (const message of messages) {
+              let event = "message";
+              let data = "";
+              for (const line of message.split("\n")) {
+                if (line.startsWith("event:")) event = line.slice(6).trim();
+                else if (line.startsWith("data:")) data += line.slice(5).trim();
+              }
+              if (event === "complete") {
+                finish(resolve, JSON.parse(data));
+              } else if (event === "error") {
+                finish(reject, new Error("Analysis failed on server"));
+              }
+            }
+          };
+
+          xhr.onprogress = parseEvents;
+          xhr.onload = () => {
+            parseEvents();
+            // Stream closed without a result: finish by polling
+            if (!settled) finish(resolve, null);
+          };
+          xhr.onerror = () => finish(resolve, null);
+
+          // Timeout after 60 seconds
+          const timeout = setTimeout(() => finish(reject, new Error("Analysis timeout")), 60000);
+
+          xhr.open("GET", API.stream(jobId));
+          xhr.setRequestHeader("Accept", "text/event-stream");
+          xhr.send();
+        });
+      };
+
+      const resultsData = (await streamResults()) || (await pollResults());
 
       // Navigate to Results screen
       navigation.navigate('Results', {
@@ -6,5 +6,6 @@ export const API = {
   upload: `${API_BASE_URL}/api/upload`,
   analyze: `${API_BASE_URL}/api/analyze`,
   status: (jobId) => `${API_BASE_URL}/api/status/${jobId}`,
+  stream: (jobId) => `${API_BASE_URL}/api/stream/${jobId}`,
   results: (jobId) => `${API_BASE_URL}/api/results/${jobId}`,
 };
\ No newline at end of file
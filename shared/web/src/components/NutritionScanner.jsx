@@ -141,36 +141,87 @@ function NutritionScanner() {
          throw new Error("Failed to start analysis job.");
       }
 
-      // 3. Start Polling
       setStatus("pending");
 
-      const interval = setInterval(async () => {
-        try {
-          const statusResponse = await fetch(`http://127.0.0.1:5002/api/status/${jobId}`);
-          const statusData = await statusResponse.json();
+      const showResults = (resultsData) => {
+        setStatus("complete");
+        setResults(resultsData['results'] || {});
+        setFailing(resultsData['failing'] || []);
 
-          if (statusData.status === "complete") {
-            setStatus("complete");
-            clearInterval(interval); // stop polling
-
-            // 4. Fetch final results
-            const resultsResponse = await fetch(`http://127.0.0.1:5002/api/results/${jobId}`);
-            const resultsData = await resultsResponse.json();
+        // 5. Transition to Results View using React Router
+        navigate('/results');
+      };
 
-            setResults(resultsData['results'] || {});
-            setFailing(resultsData['failing'] || []);
+      const showError = (err) => {
+        console.error("Analysis error:", err);
+        setStatus("error");
+        navigate('/'); // Navigate back home on error
+        alert("An error occurred during analysis.");
+      };
 
-            // 5. Transition to Results View using React Router
-            navigate('/results');
+      // 3b. Fallback: poll for status every 2 seconds
+      const pollForResults = () => {
+        const interval = setInterval(async () => {
+          try {
+            const statusResponse = await fetch(`http://127.0.0.1:5002/api/status/${jobId}`);
+            const statusData = await statusResponse.json();
+
+            if (statusData.status === "complete") {
+              clearInterval(interval); // stop polling
+
+              // 4. Fetch final results
+              const resultsResponse = await fetch(`http://127.0.0.1:5002/api/results/${jobId}`);
+              showResults(await resultsResponse.json());
+            } else if (statusData.status === "error") {
+              clearInterval(interval);
+              showError(statusData.error);
+            }
+          } catch (err) {
+            clearInterval(interval);
+            showError(err);
           }
-        } catch (err) {
-          console.error("Polling error:", err);
-          setStatus("error");
-          clearInterval(interval);
-          navigate('/'); // Navigate back home on error
-          alert("An error occurred during analysis polling.");
+        }, 2000); // poll every 2 seconds
+      };
+
+      // 3. Stream progress; the server pushes the final results when done
+      if (typeof EventSource === "undefined") {
+        pollForResults();
+        return;
+      }
+
+      const stream = new EventSource(`http://127.0.0.1:5002/api/stream/${jobId}`);
+      let received = false;
+
+      stream.addEventListener("status", (e) => {
+        received = true;
+        setStatus(JSON.parse(e.data).status);
+      });
+
+      stream.addEventListener("progress", (e) => {
+        received = true;
+        const event = JSON.parse(e.data);
+        if (event.type === "ingredient") {
+          setStatus(`analyzing (${event.done}/${event.total})`);
+        }
+      });
+
+      stream.addEventListener("complete", (e) => {
+        stream.close();
+        showResults(JSON.parse(e.data));
+      });
+
+      stream.addEventListener("error", (e) => {
+        if (e.data) {
+          // Error reported by the server
+          stream.close();
+          showError(JSON.parse(e.data).error);
+        } else if (!received) {
+          // Streaming not available (e.g. blocked by a proxy): poll instead
+          stream.close();
+          pollForResults();
         }
-      }, 2000); // poll every 2 seconds
+        // Otherwise the connection dropped mid-stream and EventSource reconnects
+      });
 
     } catch (error) {
       console.error('Error initiating analysis:', error);